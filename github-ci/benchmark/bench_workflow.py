@@ -0,0 +1,398 @@
+'''
+Offline benchmark of the CI workflow
+
+Runs bioworkflow on the sample recipes of benchmark/recipes against local stand-ins:
+
+* fake GitHub / bio.tools / bioconda / spdx HTTP server (requests to these hosts are redirected to it)
+* local docker registry (registry:2 container, image must be available locally)
+* local S3 (moto server, or any endpoint given with --s3-endpoint)
+
+Docker daemon is the local one, recipes are built from --base-image pushed to the local registry,
+so no network access is needed.
+
+Reports per stage latency (from workflow metrics), HTTP request counts and peak memory.
+
+    python benchmark/bench_workflow.py --rounds 3 --jobs 2 --output bench.json
+'''
+import json
+import logging
+import os
+import re
+import resource
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import click
+import docker
+import requests
+
+from biocontainersci.ci import CI
+from biocontainersci.licenses import SPDX_SNAPSHOT
+from biocontainersci.main import run_jobs
+from biocontainersci.metrics import Metrics
+from biocontainersci.utils import CommentBuffer
+
+RECIPES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipes')
+FAKE_HOSTS = ['api.github.com', 'bio.tools', 'bioconda.github.io', 'raw.githubusercontent.com']
+# bio.tools entries known by fake server
+BIOTOOLS_IDS = ['bench-hello']
+# workflow steps needing external tools, skipped steps return False
+# (anchore and biotools are skipped by config)
+SKIPPABLE = ['arm', 'singularity']
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    '''
+    Fake external services, path is /<host>/<original path>
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logging.debug('[bench][http] ' + format % args)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PATCH(self):
+        self.handle_request('PATCH')
+
+    def handle_request(self, method):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        (host, path) = (self.path.lstrip('/').split('/', 1) + [''])[:2]
+        path = '/' + path.split('?')[0]
+        self.server.count(host, method, path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        handler = {
+            'api.github.com': self.github,
+            'bio.tools': self.biotools,
+            'bioconda.github.io': self.bioconda,
+            'raw.githubusercontent.com': self.spdx
+        }.get(host)
+        if handler is None:
+            return self.reply(404, {})
+        return handler(method, path, body)
+
+    def reply(self, status, content, headers=None):
+        data = content if isinstance(content, bytes) else json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for (name, value) in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def github(self, method, path, body):
+        headers = {'X-RateLimit-Remaining': '5000', 'X-RateLimit-Reset': str(int(time.time()) + 3600)}
+        comments = self.server.comments
+        if path == '/user' and method == 'GET':
+            return self.reply(200, {'login': 'biocontainers-bench'}, headers)
+        m = re.match(r'^/repos/[^/]+/[^/]+/issues/(\d+)/comments$', path)
+        if m and method == 'GET':
+            return self.reply(200, [c for c in comments if c['pr'] == m.group(1)], headers)
+        if m and method == 'POST':
+            comment = {'id': len(comments) + 1, 'pr': m.group(1), 'user': {'login': 'biocontainers-bench'}, 'body': json.loads(body)['body']}
+            comments.append(comment)
+            return self.reply(201, comment, headers)
+        m = re.match(r'^/repos/[^/]+/[^/]+/issues/comments/(\d+)$', path)
+        if m and method == 'PATCH':
+            for comment in comments:
+                if str(comment['id']) == m.group(1):
+                    comment['body'] = json.loads(body)['body']
+                    return self.reply(200, comment, headers)
+        if re.match(r'^/repos/[^/]+/[^/]+/statuses/\w+$', path) and method == 'POST':
+            return self.reply(201, json.loads(body), headers)
+        return self.reply(404, {'message': 'Not Found'}, headers)
+
+    def biotools(self, method, path, body):
+        m = re.match(r'^/api/tool/([^/]+)/?$', path)
+        if m and m.group(1) in BIOTOOLS_IDS:
+            return self.reply(200, {'biotoolsID': m.group(1)})
+        return self.reply(404, {'detail': 'Not found.'})
+
+    def bioconda(self, method, path, body):
+        return self.reply(404, b'')
+
+    def spdx(self, method, path, body):
+        etag = '"bench-spdx"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, b'', {'ETag': etag})
+        with open(SPDX_SNAPSHOT, 'rb') as fp:
+            return self.reply(200, fp.read(), {'ETag': etag})
+
+
+class FakeServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, latency=0):
+        super().__init__(('127.0.0.1', 0), FakeHandler)
+        self.latency = latency
+        self.requests = {}
+        self.comments = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def count(self, host, method, path):
+        key = '%s %s %s' % (method, host, re.sub(r'/\d+', '/:n', path))
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def redirect_requests(fake_url):
+    '''
+    Send requests to FAKE_HOSTS to fake server
+    '''
+    send = requests.adapters.HTTPAdapter.send
+
+    def fake_send(adapter, request, **kwargs):
+        url = urllib.parse.urlsplit(request.url)
+        if url.hostname in FAKE_HOSTS:
+            request.url = fake_url + '/' + url.hostname + url.path + ('?' + url.query if url.query else '')
+        return send(adapter, request, **kwargs)
+
+    requests.adapters.HTTPAdapter.send = fake_send
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_registry(docker_client):
+    '''
+    Start a registry:2 container, returns (container, registry url)
+    '''
+    container = docker_client.containers.run('registry:2', detach=True, auto_remove=True, ports={'5000/tcp': ('127.0.0.1', None)})
+    container.reload()
+    url = 'localhost:' + container.ports['5000/tcp'][0]['HostPort']
+    for _ in range(50):
+        try:
+            if requests.get('http://' + url + '/v2/', timeout=1).status_code == 200:
+                return (container, url)
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    container.stop()
+    raise Exception('local registry did not start')
+
+
+def start_s3(bucket):
+    '''
+    Start a moto S3 server, returns (server, endpoint), (None, None) if moto server is not installed
+    '''
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        return (None, None)
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    endpoint = 'http://127.0.0.1:%d' % port
+    boto3.client('s3', endpoint_url=endpoint, region_name='us-east-1', aws_access_key_id='bench', aws_secret_access_key='bench').create_bucket(Bucket=bucket)
+    return (server, endpoint)
+
+
+def workspace(base_image):
+    '''
+    Copy recipes to a temporary workspace, with @BASE_IMAGE@ replaced in Dockerfiles
+
+    Returns (workspace dir, files)
+    '''
+    workdir = tempfile.mkdtemp(prefix='bench-workspace-')
+    files = []
+    for container in sorted(os.listdir(RECIPES)):
+        for version in sorted(os.listdir(os.path.join(RECIPES, container))):
+            shutil.copytree(os.path.join(RECIPES, container, version), os.path.join(workdir, container, version))
+            dockerfile = os.path.join(workdir, container, version, 'Dockerfile')
+            with open(dockerfile, 'r') as fp:
+                content = fp.read()
+            with open(dockerfile, 'w') as fp:
+                fp.write(content.replace('@BASE_IMAGE@', base_image))
+            files.append({'container': container, 'version': version})
+    return (workdir, files)
+
+
+def bench_config(registry, s3_endpoint, tmpdir, pull_request):
+    return {
+        'github': {'token': 'bench', 'retries': 0},
+        'biotools': {'token': '', 'ssh_key': ''},
+        'dockerhub': {'username': '', 'password': ''},
+        'registry': {'url': registry},
+        'anchore': {'url': '', 'username': '', 'password': ''},
+        's3': {
+            'endpoint': s3_endpoint,
+            'access_key': 'bench',
+            'secret_access_key': 'bench',
+            'bucket': 'biocontainers',
+            'region': 'us-east-1'
+        },
+        'singularity': {'tmp': tmpdir, 'nohttps': True, 'sources': ['docker-daemon', 'registry']},
+        'tmpdir': tmpdir,
+        'commit': '0' * 40,
+        'dry': False,
+        'pull_number': '1' if pull_request else None
+    }
+
+
+def skip(steps):
+    for step in steps:
+        method = 'workflow_arm' if step == 'arm' else step
+        logging.info('[bench] skip ' + step)
+        setattr(CI, method, lambda *args, **kwargs: False)
+
+
+def report(rounds):
+    '''
+    Aggregate stages of all rounds: count, mean, p50 and max duration, outcomes
+    '''
+    stages = {}
+    for run in rounds:
+        for s in run['stages']:
+            stage = stages.setdefault((s['stage'], s['arch']), {'durations': [], 'outcomes': {}, 'bytes': {}})
+            stage['durations'].append(s['duration'])
+            stage['outcomes'][s['outcome']] = stage['outcomes'].get(s['outcome'], 0) + 1
+            for (kind, size) in s['bytes'].items():
+                stage['bytes'][kind] = max(stage['bytes'].get(kind, 0), size)
+    summary = []
+    for ((name, arch), stage) in sorted(stages.items(), key=lambda item: item[0]):
+        durations = sorted(stage['durations'])
+        summary.append({
+            'stage': name,
+            'arch': arch,
+            'count': len(durations),
+            'mean': sum(durations) / len(durations),
+            'p50': durations[len(durations) // 2],
+            'max': durations[-1],
+            'outcomes': stage['outcomes'],
+            'max_bytes': stage['bytes']
+        })
+    return summary
+
+
+@click.command()
+@click.option('--rounds', default=1, type=int, help='number of runs over the recipes')
+@click.option('--jobs', default=1, type=int, help='number of containers to build in parallel')
+@click.option('--base-image', default='busybox:latest', help='local image used as recipes base image')
+@click.option('--registry', default=None, help='existing local registry (host:port), default starts a registry:2 container')
+@click.option('--s3-endpoint', default=None, help='existing S3 endpoint (bucket biocontainers), default starts a moto server')
+@click.option('--latency', default=0.0, type=float, help='latency (seconds) added by fake HTTP server')
+@click.option('--pull-request/--no-pull-request', default=False, help='run pull request workflow (checks and tests only)')
+@click.option('--skip', 'skip_steps', multiple=True, type=click.Choice(SKIPPABLE), help='workflow step to skip, default arm (and singularity if not available)')
+@click.option('--output', default=None, help='JSON report file')
+def run(rounds, jobs, base_image, registry, s3_endpoint, latency, pull_request, skip_steps, output):
+    logging.basicConfig(level=os.environ.get('LOGLEVEL', 'WARNING'), format='%(levelname)s:[%(threadName)s]:%(message)s')
+    tracemalloc.start()
+    docker_client = docker.DockerClient(base_url='unix://var/run/docker.sock', timeout=600)
+
+    skip_steps = list(skip_steps) or ['arm']
+    s3_server = None
+    if 'singularity' not in skip_steps and not pull_request:
+        if not shutil.which('singularity'):
+            click.echo('singularity not found, skip singularity')
+            skip_steps.append('singularity')
+        elif not s3_endpoint:
+            (s3_server, s3_endpoint) = start_s3('biocontainers')
+            if s3_server is None:
+                click.echo('moto server not installed and no --s3-endpoint, skip singularity')
+                skip_steps.append('singularity')
+    skip(skip_steps)
+
+    fake = FakeServer(latency=latency).start()
+    redirect_requests(fake.url)
+
+    registry_container = None
+    if not registry:
+        (registry_container, registry) = start_registry(docker_client)
+    tmpdir = tempfile.mkdtemp(prefix='bench-tmp-')
+    workdir = None
+    rounds_records = []
+    results = {}
+    try:
+        # base image in local registry, so that builds can pull it offline
+        local_base = registry + '/bench/base:latest'
+        docker_client.images.get(base_image).tag(local_base)
+        for line in docker_client.images.push(local_base, stream=True, decode=True):
+            if 'error' in line:
+                raise Exception('failed to push base image: ' + str(line['error']))
+        (workdir, files) = workspace(local_base)
+        os.environ['GITHUB_WORKSPACE'] = workdir
+
+        for i in range(rounds):
+            config = bench_config(registry, s3_endpoint or '', tmpdir, pull_request)
+            config['comments'] = CommentBuffer()
+            config['run_metrics'] = Metrics(config)
+            start = time.time()
+            round_results = run_jobs(config, files, jobs)
+            config['comments'].flush(config)
+            record = config['run_metrics'].run_record(round_results)
+            rounds_records.append(record)
+            for (name, status) in round_results.items():
+                results.setdefault(name, []).append(status)
+            click.echo('round %d: %d containers in %.1fs' % (i + 1, len(files), time.time() - start))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        if registry_container is not None:
+            registry_container.stop()
+        if s3_server is not None:
+            s3_server.stop()
+        fake.shutdown()
+
+    (_, heap_peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    summary = {
+        'rounds': rounds,
+        'jobs': jobs,
+        'skipped': skip_steps,
+        'results': results,
+        'stages': report(rounds_records),
+        'requests': dict(sorted(fake.requests.items())),
+        'memory': {
+            'python_heap_peak': heap_peak,
+            # linux: KB
+            'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        }
+    }
+
+    click.echo('%-14s %-6s %5s %9s %9s %9s  %s' % ('stage', 'arch', 'count', 'mean(s)', 'p50(s)', 'max(s)', 'outcomes'))
+    for stage in summary['stages']:
+        click.echo('%-14s %-6s %5d %9.2f %9.2f %9.2f  %s' % (
+            stage['stage'], stage['arch'], stage['count'], stage['mean'], stage['p50'], stage['max'],
+            ', '.join(['%s=%d' % item for item in sorted(stage['outcomes'].items())])
+        ))
+    click.echo('requests:')
+    for (request, count) in summary['requests'].items():
+        click.echo('  %5d %s' % (count, request))
+    click.echo('memory: python heap peak %.1f MB, max rss %.1f MB' % (
+        heap_peak / (1024 * 1024), summary['memory']['max_rss'] / (1024 * 1024)
+    ))
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(summary, fp, indent=2)
+
+
+if __name__ == '__main__':
+    run()
@@ -4,9 +4,9 @@
 # ssh rsa key must be mounted in container if any
 
 import shutil
-import requests
 import os
 import logging
+import threading
 import git
 import datetime
 from copy import deepcopy
@@ -16,17 +16,19 @@ try:
 except ImportError:
     from yaml import Dumper
 
-from biocontainersci.utils import BiocontainersCIException
+from biocontainersci.utils import BiocontainersCIException, github_client
 
 
 class Biotools:
 
     GIT_REPO = 'git@github.com:bio-tools/content.git'
     BOT_LABEL = 'biocontainers-bot-import'
+    LOCK = threading.Lock()
 
     def __init__(self, config):
         self.config = config
         self.REPO = os.path.join(config.get('tmpdir', '/tmp'), 'biotools-content')
+        self.github = github_client(config, token=config['biotools']['token'])
 
     def repo_setup(self, branch):
         repo = None
@@ -57,16 +59,16 @@ class Biotools:
         return (repo, branch)
 
     def get_pr_branch(self, id):
-        github_url = 'https://api.github.com/repos/bio-tools/content/pulls/%s' % id
-        res = requests.get(github_url)
+        github_url = '/repos/bio-tools/content/pulls/%s' % id
+        res = self.github.get(github_url)
         pr = res.json()
         pr_branch = pr['head']['ref']
         logging.info("[biotools] PR %d branch = %s" % (id, pr_branch))
         return pr_branch
 
     def has_pr(self):
-        github_url = 'https://api.github.com/search/issues'
-        res = requests.get(github_url, params={
+        github_url = '/search/issues'
+        res = self.github.get(github_url, params={
             'q': 'is:pr state:open label:%s repo:bio-tools/content' % self.BOT_LABEL
         })
         # ?q=is:pr%20state:open%20label:%20repo:bio-tools/content'
@@ -83,19 +85,14 @@ class Biotools:
 
     def create_pr(self, branch):
         logging.info("[biotools] Create new PR for branch %s" % branch)
-        headers = {
-            'Accept': 'application/vnd.github.v3+json',
-            'Authorization': 'token ' + self.config['biotools']['token']
-        }
-        github_url = 'https://api.github.com/repos/%s/pulls' % ("bio-tools/content")
-        res = requests.post(
+        github_url = '/repos/%s/pulls' % ("bio-tools/content")
+        res = self.github.post(
             github_url,
             json={
                 'title': "biocontainers-bot metadata import PR",
                 'head': branch,
                 "base": "master"
-            },
-            headers=headers
+            }
         )
         if res.status_code not in [200, 201]:
             logging.error("[biotools] Failed to create pull request: %s", res.text)
@@ -103,14 +100,13 @@ class Biotools:
         pr = res.json()
         issue = pr['number']
         logging.info("[biotools] PR %d created" % issue)
-        github_url = 'https://api.github.com/repos/%s/issues/%d' % ("bio-tools/content", issue)
+        github_url = '/repos/%s/issues/%d' % ("bio-tools/content", issue)
 
-        res = requests.post(
+        res = self.github.post(
             github_url,
             json={
                 'labels': [self.BOT_LABEL],
-            },
-            headers=headers
+            }
         )
         if res.status_code not in [200]:
             logging.error("Failed to add issue label: %d" % res.status_code)
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+class Checkpoints:
+    '''
+    Ledger of completed workflow stages, keyed by container, tag and image digest
+
+    Ledger is a JSON file per container tag in checkpoints.dir (tmpdir/checkpoints by default).
+    Stages are recorded for the pushed image digest, a push of an other digest starts a new ledger.
+    Stages are only skipped in resume mode, ledger is not used in dry mode.
+    '''
+
+    LOCK = threading.Lock()
+
+    def __init__(self, config, f):
+        root = (config.get('checkpoints') or {}).get('dir') or os.path.join(config.get('tmpdir', '/tmp'), 'checkpoints')
+        self.path = os.path.join(root, f['container'], f['tag'] + '.json')
+        self.digest = f.get('digest')
+        self.resume = config.get('resume', False)
+        self.enabled = not config['dry']
+
+    def load(self):
+        '''
+        Ledger content, empty dict if none
+        '''
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as fp:
+                return json.load(fp)
+        except Exception as e:
+            logging.warning('[ci][checkpoints] failed to read ' + self.path + ': ' + str(e))
+            return {}
+
+    def start(self, image_id, recipe, labels):
+        '''
+        Record push of image digest, stages of an other digest are dropped
+        '''
+        if not self.enabled or not self.digest:
+            return
+        with self.LOCK:
+            ledger = self.load()
+            if ledger.get('digest') != self.digest:
+                ledger = {'digest': self.digest, 'stages': {}}
+            ledger.update({'image_id': image_id, 'recipe': recipe, 'labels': labels})
+            ledger['stages']['push'] = time.time()
+            self._write(ledger)
+
+    def record(self, stage):
+        if not self.enabled or not self.digest:
+            return
+        with self.LOCK:
+            ledger = self.load()
+            if ledger.get('digest') != self.digest:
+                logging.warning('[ci][checkpoints] no ledger for digest ' + self.digest + ', not recording ' + stage)
+                return
+            ledger['stages'][stage] = time.time()
+            self._write(ledger)
+
+    def done(self, stage):
+        '''
+        Stage already done for image digest (resume mode only)
+        '''
+        if not self.resume or not self.enabled or not self.digest:
+            return False
+        ledger = self.load()
+        if ledger.get('digest') == self.digest and stage in ledger.get('stages', {}):
+            logging.info('[ci][checkpoints] ' + stage + ' already done for ' + self.digest + ', skipping')
+            return True
+        return False
+
+    def _write(self, ledger):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(ledger, fp)
+        os.replace(tmp_path, self.path)
@@ -1,18 +1,35 @@
+import collections
 import docker
+import hashlib
+import io
 import os
 import logging
+import queue
 import re
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 
 import requests
 import json
-import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 # import botocore.vendored.requests.packages.urllib3 as urllib3
 
+from dockerfile_parse import DockerfileParser
 from python_on_whales import docker as docker_whale
 
 from biocontainersci.utils import send_github_pr_comment, send_status, BiocontainersCIException
 from biocontainersci.biotools import Biotools
+from biocontainersci.checkpoints import Checkpoints
+from biocontainersci.cleanup import Cleanup
+from biocontainersci.licenses import SpdxIndex
+from biocontainersci.locks import HostSemaphore
+from biocontainersci.metrics import Metrics
+from biocontainersci.push import PushProgress
+from biocontainersci.s3 import S3Uploader
+from biocontainersci.singularity_cache import LayerCache
 
 
 class CI:
@@ -20,9 +37,13 @@ class CI:
     Class to manage build/check of containers
     '''
 
+    CLEAN_TEST_MARKER = '# ci:clean'
+
     def __init__(self, config):
         self.config = config
         self.docker_client = docker.DockerClient(base_url='unix://var/run/docker.sock', timeout=600)
+        self.session = requests.Session()
+        self.metrics = config.get('run_metrics') or Metrics(config)
         # urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
     def name(self, f, is_arm=False):
@@ -59,83 +80,404 @@ class CI:
             base_name += "_arm"
 
         return base_name
-    def run_test(self, f: dict, test: str):
+
+    def base_image(self, f):
         '''
-        Execute a test against container
+        Base image of Dockerfile (first FROM instruction)
+        '''
+        with open(os.path.join(self.workdir(), f['container'], f['version'], 'Dockerfile'), 'r') as d:
+            for line in d.readlines():
+                elts = line.strip().split()
+                if len(elts) > 1 and elts[0].upper() == 'FROM':
+                    return elts[1]
+        return None
+
+    def cache_name(self, f, is_arm=False):
+        '''
+        Build cache image name in local registry, keyed on container and base image
+
+        Key also contains a period number changing every build.cache.max_age days,
+        first build of a period has no cache and is a clean rebuild.
+        '''
+        if not self.config['registry']['url']:
+            return None
+        max_age = self.config.get('build', {}).get('cache', {}).get('max_age', 30)
+        period = int(time.time() // (max_age * 86400))
+        base = re.sub('[^a-zA-Z0-9_.-]', '_', str(self.base_image(f)))[-100:]
+        base += '-' + str(period)
+        if is_arm:
+            base += '_arm'
+        return self.config['registry']['url'] + '/biocontainers-cache/' + f['container'] + ':' + base
+
+    def build_cache(self, f, is_arm=False):
+        '''
+        Pull build cache image from local registry
+
+        Returns the list of images to use as cache source, None if cache
+        should not be used (disabled or no cache for current period)
+        '''
+        cache_config = self.config.get('build', {}).get('cache', {})
+        if not cache_config.get('enabled', False) or not self.cache_name(f):
+            return None
+        cache_name = self.cache_name(f, is_arm=is_arm)
+        try:
+            if is_arm:
+                cache_image = self.docker_client.images.pull(cache_name, platform='linux/arm64')
+            else:
+                cache_image = self.docker_client.images.pull(cache_name)
+        except Exception as e:
+            logging.info('[ci][build][cache] no cache for ' + cache_name + ': ' + str(e))
+            return None
+        logging.info('[ci][build][cache] use cache ' + cache_name + ' ' + cache_image.id)
+        return [cache_name]
+
+    def export_cache(self, docker_image, f, is_arm=False):
+        '''
+        Push built image to local registry as build cache
+        '''
+        cache_config = self.config.get('build', {}).get('cache', {})
+        if not cache_config.get('enabled', False) or not self.cache_name(f):
+            return
+        cache_name = self.cache_name(f, is_arm=is_arm)
+        try:
+            (repository, version) = cache_name.rsplit(':', 1)
+            docker_image.tag(repository, tag=version)
+            self.docker_push(cache_name)
+        except Exception as e:
+            logging.warning('[ci][build][cache] failed to export cache ' + cache_name + ': ' + str(e))
+
+    def promote(self, f, docker_image, is_arm=False):
+        '''
+        Tag the already built image for dockerhub and local registry
+
+        Image is built only once, registry names are aliases of the same image id
+        '''
+        prefix = 'arm_' if is_arm else ''
+        f[prefix + 'image_id'] = docker_image.id
+        repo_digests = docker_image.attrs.get('RepoDigests', [])
+        f[prefix + 'digest'] = repo_digests[0].split('@')[-1] if repo_digests else None
+        logging.info('[ci][build] image id ' + str(docker_image.id) + ', digest ' + str(f[prefix + 'digest']))
+
+        tags = [self.dockerhub_name(f, is_arm=is_arm)]
+        if self.local_name(f):
+            tags.append(self.local_name(f, is_arm=is_arm))
+        for tag in tags:
+            logging.info('[ci][build] tag ' + tag)
+            (repository, version) = tag.rsplit(':', 1)
+            if not docker_image.tag(repository, tag=version):
+                raise BiocontainersCIException('failed to tag image as ' + tag)
+        return tags
+
+    def test_container(self, f: dict):
+        '''
+        Start a long-lived container to exec tests into
+
+        Returns None if image defines an entrypoint, tests need to go through it
         '''
-        logging.info("[ci][test] run test: " + test)
         base_container_name = self.name(f)
+        image = self.docker_client.images.get(base_container_name)
+        if image.attrs.get('Config', {}).get('Entrypoint'):
+            logging.info('[ci][test] image has an entrypoint, use a new container per test')
+            return None
         volumes = {}
         volumes[self.workdir()] = {'bind': '/biocontainers', 'mode': 'ro'}
-        logs = self.docker_client.containers.run(
+        logging.info('[ci][test] start test container for ' + base_container_name)
+        return self.docker_client.containers.run(
             base_container_name,
-            command=test,
-            auto_remove=True,
+            entrypoint=['tail', '-f', '/dev/null'],
+            detach=True,
             volumes=volumes
         )
-        logging.info('[ci][test] logs: ' + str(logs))
-        return True
+
+    def exec_test(self, container, test: str, timeout=None):
+        '''
+        Exec test in running container, kill container on timeout
+
+        Returns (exit_code, output), exit_code is None on timeout
+        '''
+        result = {}
+
+        def target():
+            try:
+                result['exec'] = container.exec_run(test)
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            container.kill()
+            return (None, b'')
+        if 'error' in result:
+            raise result['error']
+        return result['exec']
+
+    def run_test(self, f: dict, test: str, container=None, timeout=None):
+        '''
+        Execute a test against container
+
+        If container is set, test is executed in this running container,
+        else a new container is created for the test.
+
+        Returns a dict with test, status (success/failure/timeout), exit_code, duration and output tail
+        '''
+        logging.info("[ci][test] run test: " + test)
+        start = time.time()
+        if container is not None:
+            (exit_code, logs) = self.exec_test(container, test, timeout=timeout)
+        else:
+            base_container_name = self.name(f)
+            volumes = {}
+            volumes[self.workdir()] = {'bind': '/biocontainers', 'mode': 'ro'}
+            test_container = self.docker_client.containers.run(
+                base_container_name,
+                command=test,
+                detach=True,
+                volumes=volumes
+            )
+            try:
+                exit_code = test_container.wait(timeout=timeout)['StatusCode']
+            except requests.exceptions.RequestException:
+                test_container.kill()
+                exit_code = None
+            logs = test_container.logs()
+            test_container.remove(force=True)
+
+        status = 'success'
+        if exit_code is None:
+            status = 'timeout'
+        elif exit_code != 0:
+            status = 'failure'
+        tail_lines = self.config.get('tests', {}).get('tail_lines', 20)
+        result = {
+            'test': test,
+            'status': status,
+            'exit_code': exit_code,
+            'duration': time.time() - start,
+            'output': '\n'.join(logs.decode('utf-8', errors='replace').splitlines()[-tail_lines:])
+        }
+        logging.info('[ci][test] %s: %s, exit code %s in %.2fs' % (test, status, str(exit_code), result['duration']))
+        logging.info('[ci][test] logs: ' + result['output'])
+        return result
 
     def run_tests(self, f):
         '''
         Run test-cmds.txt commands against container
+
+        Tests run in parallel, up to tests.workers containers at the same time,
+        each with a tests.timeout limit (seconds).
+        Tests are executed in warm containers reused between tests unless tests.warm is false.
+        A test ending with the "# ci:clean" marker always runs in a new container.
         '''
         base_container_name = self.name(f)
         logging.info("[ci][test] " + base_container_name)
         tests_file = os.path.join(self.workdir(), f['container'], f['version'], 'test-cmds.txt')
         if not os.path.exists(tests_file):
-            send_github_pr_comment(self.config, "No test-cmds.txt (test file) present, skipping tests")
+            send_github_pr_comment(self.config, "No test-cmds.txt (test file) present, skipping tests", section='tests')
             return
         tests = []
         with open(tests_file, 'r') as ft:
-            tests = ft.readlines()
-        status = True
-        errors = []
-        for test in tests:
-            test_status = self.run_test(f, test)
-            if not test_status:
-                errors.append(test)
-                status = False
-        if not status:
-            send_status(self.config, f['container'], False, "tests failed! " + ';'.join(errors))
+            tests = [test.strip() for test in ft.readlines() if test.strip()]
+        if not tests:
+            return
+
+        tests_config = self.config.get('tests', {})
+        timeout = tests_config.get('timeout', 600)
+        workers = min(len(tests), tests_config.get('workers', 4))
+        warm_containers = queue.Queue()
+        started = []
+        warm = False
+        if tests_config.get('warm', True):
+            container = self.test_container(f)
+            if container is not None:
+                warm = True
+                started.append(container)
+                warm_containers.put(container)
+
+        def run_one(test):
+            if test.endswith(self.CLEAN_TEST_MARKER):
+                return self.run_test(f, test[:-len(self.CLEAN_TEST_MARKER)].strip(), timeout=timeout)
+            if not warm:
+                return self.run_test(f, test, timeout=timeout)
+            try:
+                container = warm_containers.get_nowait()
+            except queue.Empty:
+                container = self.test_container(f)
+                started.append(container)
+            result = self.run_test(f, test, container=container, timeout=timeout)
+            if result['status'] != 'timeout':
+                # killed containers are not reused
+                warm_containers.put(container)
+            return result
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=threading.current_thread().name) as executor:
+                results = list(executor.map(run_one, tests))
+        finally:
+            for container in started:
+                try:
+                    container.remove(force=True)
+                except Exception:
+                    pass
+
+        f['tests'] = results
+        errors = [result['test'] + ' (' + result['status'] + ')' for result in results if result['status'] != 'success']
+        for result in results:
+            if result['status'] != 'success':
+                send_github_pr_comment(self.config, '`%s` %s (exit code %s):\n```\n%s\n```' % (result['test'], result['status'], str(result['exit_code']), result['output']), section='tests')
+        if errors:
+            send_status(self.config, f['container'], False, ["tests failed! " + ';'.join(errors)])
             raise BiocontainersCIException('tests failed')
-        send_status(self.config, f['container'], True, "All tests successful!")
+        send_status(self.config, f['container'], True, ["All tests successful!"])
 
-    def docker_logs(self, build_logs):
+    def docker_build(self, f, tag, cleanup, is_arm=False, **kwargs):
         '''
-        Show docker logs
+        Build image, build logs are streamed as they arrive
+
+        Only the last build.log_lines lines are kept, for error report.
+        Step durations are recorded in f['build_steps'] (f['arm_build_steps'] for arm).
+
+        Returns built image, raises docker.errors.BuildError on failure
         '''
-        for chunk in build_logs:
+        tail = collections.deque(maxlen=self.config.get('build', {}).get('log_lines', 200))
+        steps = []
+        image_id = None
+
+        def end_step():
+            if steps and steps[-1]['duration'] is None:
+                steps[-1]['duration'] = time.time() - steps[-1]['start']
+                logging.info('[ci][build] %s done in %.1fs' % (steps[-1]['step'].split(' :')[0], steps[-1]['duration']))
+
+        stream = self.docker_client.api.build(
+            path=os.path.join(self.workdir(), f['container'], f['version']),
+            tag=tag,
+            decode=True,
+            **kwargs
+        )
+        for chunk in stream:
             if 'stream' in chunk:
-                for line in chunk['stream'].splitlines():
+                lines = chunk['stream'].splitlines()
+                for line in lines:
                     logging.info(line)
+                    tail.append(line)
+                    if line.startswith('Step '):
+                        end_step()
+                        steps.append({'step': line, 'start': time.time(), 'duration': None})
+                    m = re.match('Successfully built ([0-9a-f]+)', line)
+                    if m and image_id is None:
+                        image_id = m.group(1)
+                cleanup.track_build_logs(lines)
+            if 'aux' in chunk and 'ID' in chunk['aux']:
+                image_id = chunk['aux']['ID']
+            if 'error' in chunk:
+                end_step()
+                logging.error('[ci][build] ' + chunk['error'])
+                tail.append(chunk['error'])
+                f[('arm_' if is_arm else '') + 'build_steps'] = steps
+                raise docker.errors.BuildError(chunk['error'], list(tail))
+        end_step()
+        f[('arm_' if is_arm else '') + 'build_steps'] = steps
+        if image_id is None:
+            raise docker.errors.BuildError('Unknown', list(tail))
+        return self.docker_client.images.get(image_id)
+
+    def build_error(self, e):
+        '''
+        Report build error with last lines of build logs
+        '''
+        build_log = getattr(e, 'build_log', None)
+        if not build_log:
+            return
+        nb_lines = self.config.get('build', {}).get('error_lines', 30)
+        send_github_pr_comment(self.config, 'Build failed:\n```\n' + '\n'.join(list(build_log)[-nb_lines:]) + '\n```', section='build')
 
     def docker_push(self, repo, auth_config=None):
         '''
         Push to registry
+
+        Returns (digest, bytes sent)
         '''
         logging.info('[ci][push]' + repo)
         if self.config['dry']:
             logging.info('[ci] dry mode, do not push')
-            return
+            return (None, 0)
+        push_config = self.config.get('push', {})
+        progress = PushProgress(repo, interval=push_config.get('progress_interval', 10))
+        digest = None
         for line in self.docker_client.images.push(repo, stream=True, decode=True, auth_config=auth_config):
-            logging.info(line)
+            if 'error' in line:
+                logging.error('[ci][push][' + repo + '] ' + str(line['error']))
+                raise BiocontainersCIException('failed to push ' + repo)
+            progress.update(line)
+            if 'aux' in line and 'Digest' in line['aux']:
+                digest = line['aux']['Digest']
+        progress.log()
+        return (digest, progress.sent())
+
+    def push_all(self, f, is_arm=False):
+        '''
+        Push to dockerhub and local registry in parallel
+
+        Bytes sent to all registries are set in f['pushed_bytes'] (f['arm_pushed_bytes'] for arm)
+
+        Returns the pushed image digest
+        '''
+        targets = []
+        if self.config['dockerhub']['username']:
+            targets.append((self.dockerhub_name(f, is_arm=is_arm), {
+                'username': self.config['dockerhub']['username'],
+                'password': self.config['dockerhub']['password']
+            }))
+        else:
+            logging.info('no dockerhub credentials, skipping')
+        if self.local_name(f):
+            targets.append((self.local_name(f, is_arm=is_arm), None))
+        else:
+            logging.info('no local registry, skipping')
+        if not targets:
+            return None
+
+        workers = min(len(targets), self.config.get('push', {}).get('workers', 2))
+        digests = []
+        errors = []
+        sent = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=threading.current_thread().name) as executor:
+            futures = {executor.submit(self.docker_push, repo, auth_config=auth): repo for (repo, auth) in targets}
+            for future in as_completed(futures):
+                try:
+                    (digest, repo_sent) = future.result()
+                    digests.append(digest)
+                    sent += repo_sent
+                except Exception as e:
+                    logging.exception('[ci][push] ' + futures[future] + ' failed: ' + str(e))
+                    errors.append(futures[future])
+        f[('arm_' if is_arm else '') + 'pushed_bytes'] = sent
+        if errors:
+            raise BiocontainersCIException('failed to push ' + ', '.join(errors))
+        digests = [d for d in digests if d]
+        return digests[0] if digests else None
 
     def biotools(self, f, labels):
         '''
         Check for biotools repo and create a PR to add new download
+
+        Returns False if skipped
         '''
         if self.config['dry']:
             logging.info('[ci][biotools] dry mode, do not create PR')
-            return
+            return False
         if not self.config['biotools']['ssh_key'] or not os.path.exists(self.config['biotools']['ssh_key']):
             logging.info('[ci][biotools] no ssh key, skipping')
-            return
+            return False
         if not self.config['biotools']['token']:
             logging.info('[ci][biotools] no github token, skipping')
-            return
+            return False
         bt = Biotools(self.config)
-        bt.run(f, labels)
+        # biotools content repo clone is shared between parallel jobs
+        with Biotools.LOCK:
+            bt.run(f, labels)
+        return True
         '''
         fpath = os.path.join(self.workdir(), f['container'], f['version'], 'Dockerfile')
         cpath = '/opt/biocontainers/' + f['container'] + '/' + f['version'] + '/Dockerfile'
@@ -158,10 +500,12 @@ class CI:
     def anchore(self, f):
         '''
         Add image to anchore security scan
+
+        Returns False if skipped or failed
         '''
         if not self.config['anchore']['url']:
             logging.warning('[ci][anchore] not configured, skipping')
-            return
+            return False
         try:
             logs = self.docker_client.containers.run(
                 image='biocontainers/anchore-cli',
@@ -172,18 +516,175 @@ class CI:
             logging.info('[ci][anchore] logs: ' + str(logs))
         except Exception as e:
             logging.exception('anchore failed, that is fine, an other process will take care of that: ' + str(e))
+            return False
+        return True
+
+    def singularity_source(self, f, source, scratch):
+        '''
+        Singularity build source uri for source type
+
+        * docker-daemon: image in local docker daemon
+        * docker-archive: image saved from local docker daemon to a tar archive
+        * registry: image pushed to local registry
+        * hub: image pushed to dockerhub
+
+        Returns None if source is not available (registry and hub need a push, not done in dry mode)
+        '''
+        if source == 'docker-daemon':
+            return 'docker-daemon://' + self.dockerhub_name(f)
+        if source == 'docker-archive':
+            archive = os.path.join(scratch, 'singimage.tar')
+            try:
+                image = self.docker_client.images.get(self.dockerhub_name(f))
+                with open(archive, 'wb') as fp:
+                    for chunk in image.save(named=True):
+                        fp.write(chunk)
+            except Exception as e:
+                logging.warning('[ci][singularity] failed to save image: ' + str(e))
+                if os.path.exists(archive):
+                    os.unlink(archive)
+                return None
+            return 'docker-archive://' + archive
+        if source == 'registry':
+            if self.config['dry'] or not self.local_name(f):
+                return None
+            return 'docker://' + self.local_name(f)
+        if source == 'hub':
+            # image is only in dockerhub if pushed by this run
+            if self.config['dry'] or not self.config['dockerhub']['username']:
+                return None
+            return 'docker://' + self.dockerhub_name(f)
+        logging.warning('[ci][singularity] unknown source ' + str(source))
+        return None
+
+    def sif_key(self, f):
+        '''
+        S3 key of singularity image
+        '''
+        return 'SingImgsRepo/' + f['container'] + '/' + f['tag'] + '/' + f['container'] + '_' + f['tag'] + '.sif'
+
+    def sif_metadata(self, f):
+        '''
+        S3 metadata of singularity image: docker image id, pushed digest and Dockerfile sha256
+
+        Image id and digest change on each rebuild without cache, recipe is stable between re-runs.
+        '''
+        metadata = {
+            'image-id': f.get('image_id'),
+            'digest': f.get('digest'),
+            'recipe': self.recipe_hash(f)
+        }
+        return {name: value for (name, value) in metadata.items() if value}
 
     def singularity(self, f):
         '''
         Convert to singularity and upload to s3
+
+        SIF images are uploaded with sif_metadata, conversion is skipped if image in s3
+        was converted from the same image, the same pushed image or the same Dockerfile.
+        SIF size is set in f['sif_size'].
+
+        Returns False if skipped
+        '''
+        metadata = self.sif_metadata(f)
+        if not self.config['dry']:
+            converted = S3Uploader(self.config).metadata(self.sif_key(f)) or {}
+            same = [name for name in metadata if converted.get(name) == metadata[name]]
+            if same:
+                logging.info('[ci][singularity] ' + self.sif_key(f) + ' already converted from same ' + same[0] + ', skipping')
+                return False
+
+        sing_config = self.config['singularity']
+        scratch_root = sing_config.get('scratch') or sing_config['tmp']
+        with HostSemaphore(os.path.join(scratch_root, '.locks'), sing_config.get('max_conversions', 2)):
+            scratch = tempfile.mkdtemp(prefix='singularity-', dir=scratch_root)
+            try:
+                sing_image = self.singularity_convert(f, scratch)
+                f['sif_size'] = os.path.getsize(sing_image)
+
+                if self.config['dry']:
+                    logging.info('[ci][singularity] dry mode, do not push image')
+                    return True
+                try:
+                    S3Uploader(self.config).upload(sing_image, self.sif_key(f), metadata=metadata)
+                except Exception:
+                    raise BiocontainersCIException('singularity s3 upload failed')
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+        return True
+
+    def singularity_convert(self, f, scratch):
+        '''
+        Convert to singularity in scratch dir, returns path to image
+
+        Build tmp dir and image are in scratch dir, layer cache is shared
+        (singularity.cache if set, else singularity.tmp) and kept between conversions.
         '''
-        sing_image = os.path.join(self.config.get('workdir', '/tmp'), 'singimage.sif')
+        sing_image = os.path.join(scratch, 'singimage.sif')
 
         my_env = os.environ.copy()
         my_env['SINGULARITY_CACHEDIR'] = self.config['singularity']['tmp']
-        my_env['SINGULARITY_TMPDIR'] = self.config['singularity']['tmp']
+        my_env['SINGULARITY_TMPDIR'] = os.path.join(scratch, 'tmp')
+        os.makedirs(my_env['SINGULARITY_TMPDIR'])
+        if self.config['singularity'].get('nohttps', False):
+            # local registry without TLS
+            my_env['SINGULARITY_NOHTTPS'] = 'true'
+
+        cache = None
+        cache_config = self.config['singularity'].get('cache')
+        if cache_config and cache_config.get('path'):
+            cache = LayerCache(cache_config['path'], cache_config.get('max_size', 50) * 1024 * 1024 * 1024)
+            my_env['SINGULARITY_CACHEDIR'] = cache.path
+        try:
+            self.singularity_build(f, scratch, sing_image, my_env, cache)
+        finally:
+            if cache is not None:
+                cache.evict()
+        return sing_image
+
+    def singularity_layers(self, f, source):
+        '''
+        Digests of image layers as stored in singularity cache for source, None if unknown
+
+        Local docker sources store uncompressed layers (image diff ids), registry sources
+        store compressed layers of the registry manifest, not known from local image.
+        '''
+        if source not in ['docker-daemon', 'docker-archive']:
+            return None
+        try:
+            return self.docker_client.images.get(self.dockerhub_name(f)).attrs['RootFS']['Layers']
+        except Exception as e:
+            logging.debug('[ci][singularity] could not get image layers: ' + str(e))
+            return None
+
+    def singularity_build(self, f, scratch, sing_image, my_env, cache=None):
+        '''
+        Run singularity build, trying sources in order
+
+        If cache is set, layers of source are pinned in cache during conversion
+        '''
         try:
-            convert_logs = subprocess.check_output(['singularity', 'build', sing_image, 'docker://' + self.dockerhub_name(f)], cwd=self.workdir(), env=my_env)
+            convert_logs = None
+            for source in self.config['singularity'].get('sources', ['docker-daemon', 'registry', 'hub']):
+                uri = self.singularity_source(f, source, scratch)
+                if uri is None:
+                    continue
+                logging.info('[ci][singularity] convert from ' + uri)
+                command = ['singularity', 'build', '--force', sing_image, uri]
+                try:
+                    if cache is None:
+                        convert_logs = subprocess.check_output(command, cwd=self.workdir(), env=my_env, stderr=subprocess.STDOUT)
+                    else:
+                        with cache.use(self.singularity_layers(f, source)):
+                            convert_logs = subprocess.check_output(command, cwd=self.workdir(), env=my_env, stderr=subprocess.STDOUT)
+                    break
+                except subprocess.CalledProcessError as e:
+                    logging.warning('[ci][singularity] convert from ' + source + ' failed: ' + str(e.output))
+                finally:
+                    if source == 'docker-archive':
+                        os.unlink(uri.replace('docker-archive://', ''))
+            if convert_logs is None:
+                raise BiocontainersCIException('no source could be converted')
             logging.info('[ci][singularity] ' + str(convert_logs))
             '''
             volumes = {
@@ -203,28 +704,6 @@ class CI:
             logging.exception('[ci][singularity] convert failed: ' + str(e))
             raise BiocontainersCIException('singularity conversion failed')
 
-        if self.config['dry']:
-            logging.info('[ci][singularity] dry mode, do not push image')
-            return
-        try:
-            s3_client = boto3.client(
-                service_name="s3",
-                region_name=self.config['s3']['region'],
-                endpoint_url=self.config['s3']['endpoint'],
-                verify=False,
-                aws_access_key_id=self.config['s3']['access_key'],
-                aws_secret_access_key=self.config['s3']['secret_access_key'])
-
-            s3_client.upload_file(sing_image, self.config['s3']['bucket'], 'SingImgsRepo/' + f['container'] + '/' + f['tag'] + '/' + f['container'] + '_' + f['tag'] + '.sif')
-        except Exception:
-            os.unlink(sing_image)
-            raise BiocontainersCIException('singularity s3 upload failed')
-        # need to be root...
-        os.unlink(sing_image)
-        # s3 = boto3.resource('s3')
-        # data = open('/tmp/singimage', 'rb')
-        # s3.Bucket(self.config['s3']['bucket']).put_object(Key='SingImgsRepo/'+f['container'] + '/' + f['tag'] + '/' + f['container'] + '_' + f['tag'] + '.img', Body=data)
-
     def workdir(self):
         return os.environ.get('GITHUB_WORKSPACE', os.getcwd())
 
@@ -250,37 +729,146 @@ class CI:
             docker_whale.manifest.push(self.dockerhub_name(f), purge=True)
             docker_whale.manifest.remove(hub_manifest)
 
+    def precheck(self, f):
+        '''
+        Check Dockerfile before build: forbidden paths and labels
+        '''
+        with open(os.path.join(self.workdir(), f['container'], f['version'], 'Dockerfile'), 'r') as d:
+            lines = d.readlines()
+            for line in lines:
+                if '.aws' in line:
+                    logging.error('[ci] private biocontainers-ci directory access in dockerfile forbiden')
+                    send_github_pr_comment(self.config, 'Forbiden access to biocontainers-ci private files in Dockerfile', section='Dockerfile')
+                    raise BiocontainersCIException('private biocontainers-ci directory access in dockerfile forbiden')
+                if 'etc/biocontainers-ci' in line:
+                    logging.error('[ci] private biocontainers-ci directory access in dockerfile forbiden')
+                    send_github_pr_comment(self.config, 'Forbiden access to biocontainers-ci directory in Dockerfile', section='Dockerfile')
+                    raise BiocontainersCIException('private biocontainers-ci directory access in dockerfile forbiden')
+
+        # static labels check, labels are checked again on built image
+        try:
+            labels = self.dockerfile_labels(f)
+        except Exception as e:
+            logging.warning('[ci][precheck] failed to parse Dockerfile, skipping labels check: ' + str(e))
+            return
+        label_errors = self.static_label_errors(f, labels)
+        if label_errors:
+            send_status(self.config, self.software_name(f, labels), False, label_errors)
+            send_github_pr_comment(self.config, ', '.join(label_errors), section='labels')
+            raise BiocontainersCIException('[ci][precheck][labels] failed')
+
+    def recipe_hash(self, f):
+        '''
+        sha256 of Dockerfile
+        '''
+        with open(os.path.join(self.workdir(), f['container'], f['version'], 'Dockerfile'), 'rb') as d:
+            return hashlib.sha256(d.read()).hexdigest()
+
+    def resumable(self, f):
+        '''
+        Ledger of a previous run which pushed the image of the same Dockerfile
+
+        Returns (tag, ledger), None if not in resume mode or nothing to resume
+        '''
+        if not self.config.get('resume') or self.config['pull_number'] or self.config['dry']:
+            return None
+        try:
+            tag = self.image_tag(f, self.dockerfile_labels(f))
+        except Exception as e:
+            logging.warning('[ci][checkpoints] failed to parse Dockerfile, no resume: ' + str(e))
+            return None
+        ledger = Checkpoints(self.config, {'container': f['container'], 'tag': tag}).load()
+        if 'push' not in ledger.get('stages', {}):
+            logging.info('[ci][checkpoints] no pushed image for ' + f['container'] + ':' + tag + ', no resume')
+            return None
+        if ledger.get('recipe') != self.recipe_hash(f):
+            logging.info('[ci][checkpoints] Dockerfile changed since ' + ledger['digest'] + ' push, no resume')
+            return None
+        return (tag, ledger)
+
+    def resume(self, f):
+        '''
+        Checkpoints of a previous run which pushed the image of the same Dockerfile
+
+        Sets f tag, digest and image_id from checkpoints and returns (checkpoints, labels),
+        None if not in resume mode or nothing to resume
+        '''
+        resumable = self.resumable(f)
+        if resumable is None:
+            return None
+        (tag, ledger) = resumable
+        f['tag'] = tag
+        f['digest'] = ledger['digest']
+        f['image_id'] = ledger.get('image_id')
+        logging.info('[ci][checkpoints] resume ' + f['container'] + ':' + tag + ' from pushed image ' + f['digest'])
+        return (Checkpoints(self.config, f), ledger.get('labels') or {})
+
+    def arm_pushed(self, f):
+        '''
+        Arm image already pushed for the image of the same Dockerfile (resume mode)
+
+        Does not need the amd workflow result, ledger is found from Dockerfile
+        '''
+        resumable = self.resumable(f)
+        if resumable is None:
+            return False
+        (tag, ledger) = resumable
+        if 'arm_push' not in ledger['stages']:
+            return False
+        logging.info('[ci][checkpoints] arm_push already done for ' + ledger['digest'] + ', skipping')
+        return True
+
+    def dockerfile_labels(self, f):
+        '''
+        Labels defined in Dockerfile, with ARG/ENV substitution
+        '''
+        with open(os.path.join(self.workdir(), f['container'], f['version'], 'Dockerfile'), 'rb') as d:
+            return DockerfileParser(fileobj=io.BytesIO(d.read())).labels
+
     '''
     Execute minimal CI workflow for arm build
     * build container
+
+    If wait_for (amd workflow future) is set, arm image is only pushed once amd workflow succeeded
     '''
-    def workflow_arm(self, f):
+    def workflow_arm(self, f, wait_for=None):
         if self.config['pull_number']:
                 logging.info("[ci][build] Pull request, skip arm")
                 return False
+        if self.arm_pushed(f):
+            return True
         base_container_name = self.name(f, is_arm=True)
         logging.info('[ci][build]ARM ' + base_container_name)
 
-        build_logs = []
+        cleanup = Cleanup(self.docker_client, self.config)
+        cleanup.track_image(base_container_name)
         try:
-            (docker_image, build_logs) = self.docker_client.images.build(
-                path=os.path.join(self.workdir(), f['container'], f['version']),
-                tag=base_container_name,
-                squash=False,
-                nocache=True,
-                rm=True,
-                platform="linux/arm64",
-                pull=True
-            )
-            self.docker_logs(build_logs)
+            with self.metrics.stage(f, 'build', arch='arm64') as stage:
+                cache_from = self.build_cache(f, is_arm=True)
+                cleanup.track_image(self.cache_name(f, is_arm=True))
+                docker_image = self.docker_build(
+                    f,
+                    base_container_name,
+                    cleanup,
+                    is_arm=True,
+                    squash=False,
+                    nocache=cache_from is None,
+                    cache_from=cache_from,
+                    rm=True,
+                    forcerm=True,
+                    platform="linux/arm64",
+                    pull=True
+                )
+                stage['bytes']['image_size'] = docker_image.attrs.get('Size')
         except Exception as e:
-            self.docker_logs(build_logs)
             logging.exception('[ci][build]ARM error ' + str(e))
+            cleanup.run()
             return False
 
         arch = docker_image.attrs.get('Architecture', "")
         if not (arch and "arm64" in arch):
             # Failed to build, fail silently
+            cleanup.run()
             return False
 
         status = False
@@ -292,64 +880,70 @@ class CI:
                 return False
             logging.info('[ci][build] ' + json.dumps(f))
 
+            if wait_for is not None:
+                logging.info('[ci][build]ARM waiting for amd64 workflow')
+                if not wait_for.result():
+                    raise BiocontainersCIException('amd64 workflow failed, skip arm push')
+
             # tag for docker and local registry
-            logging.info("tag for dockerhub")
-            self.docker_client.images.build(
-                path=os.path.join(self.workdir(), f['container'], f['version']),
-                tag=self.dockerhub_name(f, is_arm=True),
-                squash=False,
-                nocache=False,
-                rm=True,
-                platform="linux/arm64",
-            )
-            if self.local_name(f):
-                logging.info("tag for local registry")
-                self.docker_client.images.build(
-                    path=os.path.join(self.workdir(), f['container'], f['version']),
-                    tag=self.local_name(f, is_arm=True),
-                    squash=False,
-                    nocache=False,
-                    rm=True,
-                    platform="linux/arm64"
-                )
+            for tag in self.promote(f, docker_image, is_arm=True):
+                cleanup.track_image(tag)
 
             # push
-            if self.config['dockerhub']['username']:
-                self.docker_push(self.dockerhub_name(f, is_arm=True), auth_config={
-                    'username': self.config['dockerhub']['username'],
-                    'password': self.config['dockerhub']['password']
-                })
-            else:
-                logging.info('no dockerhub credentials, skipping')
-            if self.local_name(f):
-                self.docker_push(self.local_name(f, is_arm=True))
-            else:
-                logging.info('no local registry, skipping')
+            with self.metrics.stage(f, 'push', arch='arm64') as stage:
+                f['arm_digest'] = self.push_all(f, is_arm=True) or f['arm_digest']
+                stage['bytes']['pushed'] = f.get('arm_pushed_bytes')
+            Checkpoints(self.config, f).record('arm_push')
+            self.export_cache(docker_image, f, is_arm=True)
 
             status = True
         except Exception as e:
             logging.exception('[ci][workflow] error: ' + str(e))
             status = False
+        finally:
+            cleanup.run()
 
-        try:
-            self.docker_client.images.remove(image=self.name(f, is_arm=True), force=True)
-        except Exception:
-            pass
-        try:
-            self.docker_client.images.remove(image=self.dockerhub_name(f, is_arm=True), force=True)
-        except Exception:
-            pass
-        try:
-            self.docker_client.images.remove(image=self.local_name(f, is_arm=True), force=True)
-        except Exception:
-            pass
+        return status
 
-        logging.info('Docker images prune')
-        self.docker_client.images.prune()
+    def post_push(self, f, labels, checkpoints):
+        '''
+        Stages after image push, stages done are recorded in checkpoints
+        and skipped if already done (resume mode)
+        '''
+        with self.metrics.stage(f, 'anchore') as stage:
+            if checkpoints.done('anchore') or not self.anchore(f):
+                stage['outcome'] = 'skipped'
+            else:
+                checkpoints.record('anchore')
 
-        logging.info('Docker containers prune')
-        self.docker_client.containers.prune()
-        return status
+        # bio-tools PR
+        with self.metrics.stage(f, 'biotools') as stage:
+            if checkpoints.done('biotools') or not self.biotools(f, labels):
+                stage['outcome'] = 'skipped'
+            else:
+                checkpoints.record('biotools')
+
+        # singularity
+        with self.metrics.stage(f, 'singularity') as stage:
+            if checkpoints.done('singularity'):
+                stage['outcome'] = 'skipped'
+            else:
+                if not self.singularity(f):
+                    stage['outcome'] = 'skipped'
+                stage['bytes']['sif_size'] = f.get('sif_size')
+                # also done if skipped, image in s3 is up to date
+                checkpoints.record('singularity')
+                logging.info('Singularity build done')
+
+    def manifest(self, f):
+        '''
+        Build multi-arch manifest, skipped if already done (resume mode)
+        '''
+        checkpoints = Checkpoints(self.config, f)
+        if checkpoints.done('manifest'):
+            return
+        self.build_manifest(f)
+        checkpoints.record('manifest')
 
     '''
     Execute CI workflow
@@ -362,221 +956,253 @@ class CI:
         base_container_name = self.name(f)
         logging.info('[ci][build] ' + base_container_name)
 
-        # check for dockerfile
-        with open(os.path.join(self.workdir(), f['container'], f['version'], 'Dockerfile'), 'r') as d:
-            lines = d.readlines()
-            for line in lines:
-                if '.aws' in line:
-                    logging.error('[ci] private biocontainers-ci directory access in dockerfile forbiden')
-                    send_github_pr_comment(self.config, 'Forbiden access to biocontainers-ci private files in Dockerfile')
-                    raise BiocontainersCIException('private biocontainers-ci directory access in dockerfile forbiden')
-                if 'etc/biocontainers-ci' in line:
-                    logging.error('[ci] private biocontainers-ci directory access in dockerfile forbiden')
-                    send_github_pr_comment(self.config, 'Forbiden access to biocontainers-ci directory in Dockerfile')
-                    raise BiocontainersCIException('private biocontainers-ci directory access in dockerfile forbiden')
+        self.precheck(f)
+
+        resumed = self.resume(f)
+        if resumed is not None:
+            (checkpoints, labels) = resumed
+            try:
+                self.post_push(f, labels, checkpoints)
+            except Exception as e:
+                logging.exception('[ci][workflow] error: ' + str(e))
+                return False
+            return True
 
-        build_logs = []
+        cleanup = Cleanup(self.docker_client, self.config)
+        cleanup.track_image(base_container_name)
         try:
-            (docker_image, build_logs) = self.docker_client.images.build(
-                path=os.path.join(self.workdir(), f['container'], f['version']),
-                tag=base_container_name,
-                squash=False,
-                nocache=True,
-                rm=True,
-                pull=True
-            )
-            self.docker_logs(build_logs)
+            with self.metrics.stage(f, 'build') as stage:
+                cache_from = self.build_cache(f)
+                cleanup.track_image(self.cache_name(f))
+                docker_image = self.docker_build(
+                    f,
+                    base_container_name,
+                    cleanup,
+                    squash=False,
+                    nocache=cache_from is None,
+                    cache_from=cache_from,
+                    rm=True,
+                    forcerm=True,
+                    pull=True
+                )
+                stage['bytes']['image_size'] = docker_image.attrs.get('Size')
         except Exception as e:
-            self.docker_logs(build_logs)
             logging.exception('[ci][build] error ' + str(e))
+            self.build_error(e)
+            cleanup.run()
             raise BiocontainersCIException('failed to build')
         status = False
         try:
             labels = docker_image.labels
             logging.info('[ci][build][labels] ' + json.dumps(labels))
-            status = self.check_labels(f, labels)
-            if not status:
-                raise BiocontainersCIException('[ci][build][labels] failed')
+            with self.metrics.stage(f, 'check_labels'):
+                status = self.check_labels(f, labels)
+                if not status:
+                    raise BiocontainersCIException('[ci][build][labels] failed')
             logging.info('[ci][build] ' + json.dumps(f))
 
-            self.run_tests(f)
+            with self.metrics.stage(f, 'run_tests') as stage:
+                self.run_tests(f)
+                if not f.get('tests'):
+                    stage['outcome'] = 'skipped'
 
             if self.config['pull_number']:
                 logging.info("[ci][build] pull request checks over")
                 return True
 
             # tag for docker and local registry
-            logging.info("tag for dockerhub")
-            self.docker_client.images.build(
-                path=os.path.join(self.workdir(), f['container'], f['version']),
-                tag=self.dockerhub_name(f),
-                squash=False,
-                nocache=False,
-                rm=True
-
-            )
-            if self.local_name(f):
-                logging.info("tag for local registry")
-                self.docker_client.images.build(
-                    path=os.path.join(self.workdir(), f['container'], f['version']),
-                    tag=self.local_name(f),
-                    squash=False,
-                    nocache=False,
-                    rm=True
-                )
+            for tag in self.promote(f, docker_image):
+                cleanup.track_image(tag)
 
             # push
-            if self.config['dockerhub']['username']:
-                self.docker_push(self.dockerhub_name(f), auth_config={
-                    'username': self.config['dockerhub']['username'],
-                    'password': self.config['dockerhub']['password']
-                })
-            else:
-                logging.info('no dockerhub credentials, skipping')
-            if self.local_name(f):
-                self.docker_push(self.local_name(f))
-            else:
-                logging.info('no local registry, skipping')
-
-            self.anchore(f)
-
-            # bio-tools PR
-            self.biotools(f, labels)
+            with self.metrics.stage(f, 'push') as stage:
+                f['digest'] = self.push_all(f) or f['digest']
+                stage['bytes']['pushed'] = f.get('pushed_bytes')
+            checkpoints = Checkpoints(self.config, f)
+            checkpoints.start(f.get('image_id'), self.recipe_hash(f), labels)
+            self.export_cache(docker_image, f)
 
-            # singularity
-            self.singularity(f)
-            logging.info('Singularity build done')
+            self.post_push(f, labels, checkpoints)
 
             status = True
         except Exception as e:
             logging.exception('[ci][workflow] error: ' + str(e))
             status = False
+        finally:
+            cleanup.run()
 
-        try:
-            self.docker_client.images.remove(image=self.name(f), force=True)
-        except Exception:
-            pass
-        try:
-            self.docker_client.images.remove(image=self.dockerhub_name(f), force=True)
-        except Exception:
-            pass
-        try:
-            self.docker_client.images.remove(image=self.local_name(f), force=True)
-        except Exception:
-            pass
+        return status
 
-        logging.info('Docker images prune')
-        self.docker_client.images.prune()
+    def check_license(self, labels: dict, timeout=None):
+        '''
+        Check license labels, returns list of comments
+        '''
+        comments = []
+        licenses = SpdxIndex(
+            self.config.get('tmpdir', '/tmp'),
+            ttl=self.config.get('spdx', {}).get('ttl', 86400),
+            timeout=timeout,
+            session=self.session
+        )
+        if labels['about.license'].startswith('http'):
+            comments.append('about.license field is a URL. license should be the license identifier (GPL-3.0 for example).')
+        if 'about.license_file' not in labels:
+            comments.append('please specify in about.license_file the location of the license file in the container, or a url to license for this release of the software.')
+        elif labels['about.license'] != "Custom License" and labels['about.license'] not in licenses:
+            comments.append('about.license field is not in spdx list: https://spdx.org/licenses/, if it is a typo error, please fix it. If this is not a standard license, please specify *Custom License* and use *about.license_file* label to specify license location (in container or url).')
+        return comments
+
+    def check_biotools(self, software, labels: dict, timeout=None):
+        '''
+        Check biotools label against bio.tools, returns list of comments
+        '''
+        comments = []
+        biotools_label = 'extra.identifiers.biotools'
+        biotools = None
+        if biotools_label in labels:
+            biotools = labels[biotools_label].strip()
 
-        logging.info('Docker containers prune')
-        self.docker_client.containers.prune()
-        return status
+        else:
+            bio = self.session.get('https://bio.tools/api/tool/' + str(software) + '/?format=json', timeout=timeout)
+            if bio.status_code != 404:
+                comments.append('Found a biotools entry matching the software name (https://bio.tools/' + labels['software'] + '), if this is the same software, please add the extra.identifiers.biotools label to your Dockerfile')
+            else:
+                comments.append('No biotools label defined, please check if tool is not already defined in biotools (https://bio.tools) and add extra.identifiers.biotools label if it exists. If it is not defined, you can ignore this comment.')
+
+        if biotools:
+            entry = biotools
+            if biotools.startswith('https://'):
+                entry = biotools.split('/')[-1]
+            bio = self.session.get('https://bio.tools/api/tool/' + str(entry) + '/?format=json', timeout=timeout)
+            if bio.status_code == 404:
+                comments.append('Could not find the defined biotools entry, please check its name on biotools')
+            else:
+                logging.info("biotools entry is ok")
+        return comments
+
+    def check_bioconda(self, labels: dict, timeout=None):
+        '''
+        Check if software exists in bioconda, returns list of comments
+        '''
+        conda_url = 'https://bioconda.github.io/recipes/' + labels['software'] + '/README.html'
+        conda = self.session.get(conda_url, timeout=timeout)
+        if conda.status_code == 200:
+            return ['Found an existing bioconda package for this software (' + conda_url + '), is this the same, then you should update the recipe in bioconda to avoid duplicates.']
+        return []
 
     '''
     Check labels in docker image
     '''
-    def check_labels(self, f: dict, labels: dict):
+    def image_tag(self, f: dict, labels: dict):
+        '''
+        Image tag: software version and container version (label version)
+        '''
+        if 'version' in labels and labels['version']:
+            return f['version'] + '_cv' + labels['version'].strip()
+        return f['version'] + '_cv1'
+
+    def software_name(self, f: dict, labels: dict):
+        '''
+        Software name from labels, directory name if label is not a valid name
+        '''
+        if 'software' not in labels or not labels['software']:
+            return 'unknown'
+        software = labels['software']
+        pattern = re.compile("^([a-z0-9_-])+$")
+        if pattern.match(software) is None:
+            logging.warning('[ci][labels] ' + software + " has invalid name, using directory name")
+            software = f['container']
+        return software
+
+    def static_label_errors(self, f: dict, labels: dict):
+        '''
+        Errors in labels defined in Dockerfile, returns list of errors
+
+        Missing labels are not errors, they can be inherited from base image
+        (or set in an other stage) and are checked on built image.
+        Labels set in Dockerfile override inherited ones, so wrong values are errors.
+        '''
         label_errors = []
-        software = 'unknown'
+        if labels.get('software.version') and f['version'] != labels['software.version'].strip():
+            label_errors.append('software.version label not matching directory version name')
+        if labels.get('about.summary') and len(labels['about.summary']) < 20:
+            label_errors.append('about.summary label not present or too short')
+        return label_errors
+
+    def label_warnings(self, labels: dict):
+        '''
+        Check labels reported with errors but not failing the check, returns list of warnings
+        '''
+        label_warnings = []
         if 'software' not in labels or not labels['software']:
-            label_errors.append('software label not present')
-            status = False
-        else:
-            software = labels['software']
-            # labels['software'].strip()
-            pattern = re.compile("^([a-z0-9_-])+$")
-            if pattern.match(labels['software']) is None:
-                logging.warning('[ci][labels] ' + software + " has invalid name, using directory name")
-                software = f['container']
-                labels['container'] = f['container']
+            label_warnings.append('software label not present')
 
         if 'base_image' not in labels or not labels['base_image']:
-            status = False
-            label_errors.append('base_image is missing in labels')
+            label_warnings.append('base_image is missing in labels')
+        return label_warnings
 
-        version = f['version']
-        status = True
+    def label_errors(self, f: dict, labels: dict):
+        '''
+        Check mandatory labels, returns list of errors
+        '''
+        label_errors = []
         if 'software.version' not in labels or not labels['software.version']:
-            status = False
             label_errors.append('software.version label not present (Upstream code version)')
-        elif version != labels['software.version'].strip():
-            status = False
+        elif f['version'] != labels['software.version'].strip():
             label_errors.append('software.version label not matching directory version name')
-        else:
-            version = labels['software.version'].strip()
 
         if 'version' not in labels or not labels['version']:
-            status = False
             label_errors.append('version label not present (Dockerfile version)')
 
         if 'about.summary' not in labels or not labels['about.summary'] or len(labels['about.summary']) < 20:
-            status = False
             label_errors.append('about.summary label not present or too short')
 
         if 'about.home' not in labels or not labels['about.home']:
-            status = False
             label_errors.append('about.home label not present')
 
         if 'about.license' not in labels or not labels['about.license']:
-            status = False
             label_errors.append('about.license label not present')
+        return label_errors
 
-        if 'version' in labels and labels['version']:
-            version = version + '_cv' + labels['version'].strip()
-        else:
-            version = version + '_cv1'
-        f['tag'] = version
+    def check_labels(self, f: dict, labels: dict):
+        software = self.software_name(f, labels)
+        if labels.get('software') and software != labels['software']:
+            labels['container'] = f['container']
+
+        status = not self.label_errors(f, labels)
+        label_errors = self.label_warnings(labels) + self.label_errors(f, labels)
+
+        f['tag'] = self.image_tag(f, labels)
 
         send_status(self.config, software, status, label_errors)
 
         if not status and label_errors:
-            send_github_pr_comment(self.config, ', '.join(label_errors))
+            send_github_pr_comment(self.config, ', '.join(label_errors), section='labels')
 
         # Warnings only
-        try:
-            if 'about.summary' in labels and len(labels['about.summary']) > 200:
-                send_github_pr_comment(self.config, 'about.summary is quite long, please keep it short < 200 chars.')
-
-            # license checks
-            spdx = requests.get('https://raw.githubusercontent.com/sindresorhus/spdx-license-list/master/spdx.json')
-            licenses = spdx.json()
-            if labels['about.license'].startswith('http'):
-                send_github_pr_comment(self.config, 'about.license field is a URL. license should be the license identifier (GPL-3.0 for example).')
-            if 'about.license_file' not in labels:
-                send_github_pr_comment(self.config, 'please specify in about.license_file the location of the license file in the container, or a url to license for this release of the software.')
-            elif labels['about.license'] != "Custom License" and labels['about.license'].replace('SPDX:', '').replace('spdx:', '') not in licenses:
-                send_github_pr_comment(self.config, 'about.license field is not in spdx list: https://spdx.org/licenses/, if it is a typo error, please fix it. If this is not a standard license, please specify *Custom License* and use *about.license_file* label to specify license location (in container or url).')
-
-            # biotools check
-            biotools_label = 'extra.identifiers.biotools'
-            biotools = None
-            if biotools_label in labels:
-                biotools = labels[biotools_label].strip()
-
-            else:
-                bio = requests.get('https://bio.tools/api/tool/' + str(software) + '/?format=json')
-                if bio.status_code != 404:
-                    send_github_pr_comment(self.config, 'Found a biotools entry matching the software name (https://bio.tools/' + labels['software'] + '), if this is the same software, please add the extra.identifiers.biotools label to your Dockerfile')
-                else:
-                    send_github_pr_comment(self.config, 'No biotools label defined, please check if tool is not already defined in biotools (https://bio.tools) and add extra.identifiers.biotools label if it exists. If it is not defined, you can ignore this comment.')
-
-            if biotools:
-                entry = biotools
-                if biotools.startswith('https://'):
-                    entry = biotools.split('/')[-1]
-                bio = requests.get('https://bio.tools/api/tool/' + str(entry) + '/?format=json')
-                if bio.status_code == 404:
-                    send_github_pr_comment(self.config, 'Could not find the defined biotools entry, please check its name on biotools')
-                else:
-                    logging.info("biotools entry is ok")
-
-            # Check if exists in conda
-            conda_url = 'https://bioconda.github.io/recipes/' + labels['software'] + '/README.html'
-            conda = requests.get(conda_url)
-            if conda.status_code == 200:
-                send_github_pr_comment(self.config, 'Found an existing bioconda package for this software (' + conda_url + '), is this the same, then you should update the recipe in bioconda to avoid duplicates.')
-
-        except Exception as e:
-            logging.warn('[ci][labels] error: ' + str(e))
+        if 'about.summary' in labels and len(labels['about.summary']) > 200:
+            send_github_pr_comment(self.config, 'about.summary is quite long, please keep it short < 200 chars.', section='labels')
+
+        # external checks run in parallel, checks not done before deadline are skipped
+        checks_config = self.config.get('checks', {})
+        timeout = checks_config.get('timeout', 10)
+        checks = [
+            ('license', self.check_license, [labels, timeout]),
+            ('biotools', self.check_biotools, [software, labels, timeout]),
+            ('bioconda', self.check_bioconda, [labels, timeout])
+        ]
+        executor = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix=threading.current_thread().name)
+        futures = [executor.submit(check, *args) for (_, check, args) in checks]
+        wait(futures, timeout=checks_config.get('deadline', 30))
+        executor.shutdown(wait=False)
+        for (check, future) in zip(checks, futures):
+            if not future.done():
+                logging.warning('[ci][labels] ' + check[0] + ' check skipped, deadline reached')
+                continue
+            try:
+                for comment in future.result():
+                    send_github_pr_comment(self.config, comment, section=check[0])
+            except Exception as e:
+                logging.warning('[ci][labels] ' + check[0] + ' check error: ' + str(e))
 
         return status
@@ -0,0 +1,91 @@
+import logging
+import os
+import shutil
+import threading
+
+from biocontainersci.locks import HostSemaphore
+
+
+class Cleanup:
+    '''
+    Remove docker images created by a workflow
+
+    Only tracked images (tags and intermediate images of the build) are removed,
+    other builds running on the host are not affected.
+    A garbage collection of old dangling images and stopped containers is run
+    in background when docker disk usage is above cleanup.disk_threshold percent.
+    '''
+
+    def __init__(self, docker_client, config):
+        self.docker_client = docker_client
+        self.config = config
+        self.images = []
+        self.intermediates = []
+        # build step is running a command (intermediate image is created), kept between log chunks
+        self.running = False
+
+    def track_image(self, image):
+        if image and image not in self.images:
+            self.images.append(image)
+
+    def track_build_logs(self, lines):
+        '''
+        Track intermediate images created by build steps (not from cache nor base image)
+
+        Can be called for each log chunk, "Running in" and image id lines come in separate chunks
+        '''
+        for line in lines:
+            line = line.strip()
+            if line.startswith('Step '):
+                self.running = False
+            elif line.startswith('---> Running in'):
+                self.running = True
+            elif line.startswith('---> ') and self.running and ' ' not in line[5:]:
+                self.intermediates.append(line[5:])
+                self.running = False
+
+    def run(self):
+        for image in self.images:
+            try:
+                self.docker_client.images.remove(image=image, force=True)
+            except Exception:
+                pass
+        # fails if image is still used by an other image or container
+        for image in reversed(self.intermediates):
+            try:
+                self.docker_client.images.remove(image=image)
+            except Exception:
+                pass
+        self.images = []
+        self.intermediates = []
+        self.running = False
+        self.gc()
+
+    def gc(self):
+        threshold = self.config.get('cleanup', {}).get('disk_threshold', 85)
+        try:
+            root = self.docker_client.info().get('DockerRootDir', '/var/lib/docker')
+            usage = shutil.disk_usage(root)
+        except Exception as e:
+            logging.debug('[ci][cleanup] could not get docker disk usage: ' + str(e))
+            return
+        percent = usage.used * 100 / usage.total
+        if percent < threshold:
+            return
+        logging.info('[ci][cleanup] docker disk usage %d%%, start garbage collection' % percent)
+        threading.Thread(target=self.collect, name='docker-gc').start()
+
+    def collect(self):
+        lock = HostSemaphore(os.path.join(self.config.get('tmpdir', '/tmp'), '.docker-gc'), 1)
+        if lock.acquire(blocking=False) is None:
+            logging.info('[ci][cleanup] garbage collection already running')
+            return
+        try:
+            until = self.config.get('cleanup', {}).get('gc_min_age', '1h')
+            self.docker_client.containers.prune(filters={'until': until})
+            self.docker_client.images.prune(filters={'dangling': True, 'until': until})
+            logging.info('[ci][cleanup] garbage collection done')
+        except Exception as e:
+            logging.warning('[ci][cleanup] garbage collection failed: ' + str(e))
+        finally:
+            lock.release()
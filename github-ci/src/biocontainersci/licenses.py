@@ -0,0 +1,107 @@
+# Only depends on requests, also used by jenkins_container_spec_check.py
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+import requests
+
+SPDX_URL = 'https://raw.githubusercontent.com/sindresorhus/spdx-license-list/master/spdx.json'
+SPDX_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spdx.json')
+
+
+class SpdxIndex:
+    '''
+    SPDX license list, cached on disk
+
+    Cache is used for ttl seconds, then revalidated with ETag/Last-Modified.
+    If download fails, use the stale cache or the bundled snapshot.
+    '''
+
+    def __init__(self, cache_dir='/tmp', ttl=86400, url=SPDX_URL, timeout=10, session=None):
+        self.cache_file = os.path.join(cache_dir, 'spdx.json')
+        self.meta_file = self.cache_file + '.meta'
+        self.ttl = ttl
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests
+        self.index = None
+
+    @staticmethod
+    def normalize(license):
+        license = license.strip()
+        if license.lower().startswith('spdx:'):
+            license = license[5:].strip()
+        return license.lower()
+
+    def __contains__(self, license):
+        if self.index is None:
+            self.load()
+        return self.normalize(license) in self.index
+
+    def load(self):
+        licenses = None
+        if os.path.exists(self.cache_file) and time.time() - os.path.getmtime(self.cache_file) < self.ttl:
+            licenses = self._read(self.cache_file)
+        if licenses is None:
+            licenses = self.refresh()
+        if licenses is None and os.path.exists(self.cache_file):
+            logging.warning('[ci][spdx] use stale cache')
+            licenses = self._read(self.cache_file)
+        if licenses is None:
+            logging.warning('[ci][spdx] use bundled snapshot')
+            licenses = self._read(SPDX_SNAPSHOT) or {}
+        self.index = {self.normalize(license): license for license in licenses}
+        return self.index
+
+    def refresh(self):
+        '''
+        Download license list if modified, returns None on error
+        '''
+        meta = {}
+        headers = {}
+        if os.path.exists(self.cache_file) and os.path.exists(self.meta_file):
+            meta = self._read(self.meta_file) or {}
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            res = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            if res.status_code == 304:
+                logging.info('[ci][spdx] license list not modified')
+                os.utime(self.cache_file)
+                return self._read(self.cache_file)
+            if res.status_code != 200:
+                logging.warning('[ci][spdx] failed to get license list: ' + str(res.status_code))
+                return None
+            licenses = res.json()
+        except Exception as e:
+            logging.warning('[ci][spdx] failed to get license list: ' + str(e))
+            return None
+        try:
+            self._write(self.cache_file, licenses)
+            self._write(self.meta_file, {
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified')
+            })
+        except Exception as e:
+            logging.warning('[ci][spdx] failed to cache license list: ' + str(e))
+        return licenses
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as fp:
+                return json.load(fp)
+        except Exception as e:
+            logging.warning('[ci][spdx] failed to read ' + path + ': ' + str(e))
+            return None
+
+    def _write(self, path, data):
+        # atomic replace, cache can be shared by parallel jobs
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_path, path)
@@ -0,0 +1,54 @@
+import fcntl
+import logging
+import os
+import time
+
+
+class HostSemaphore:
+    '''
+    Semaphore shared by all processes of the host
+
+    Each slot is a lock file in lock_dir, a slot is taken with an exclusive flock.
+    Locks are released by the system if the process dies.
+    '''
+
+    def __init__(self, lock_dir, slots, poll=5):
+        self.lock_dir = lock_dir
+        self.slots = max(1, slots)
+        self.poll = poll
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        '''
+        Take a slot, returns slot number, None if not blocking and no slot is free
+        '''
+        os.makedirs(self.lock_dir, exist_ok=True)
+        waiting = False
+        while True:
+            for slot in range(self.slots):
+                fd = open(os.path.join(self.lock_dir, 'slot-%d.lock' % slot), 'w')
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    self.fd = fd
+                    return slot
+                except OSError:
+                    fd.close()
+            if not blocking:
+                return None
+            if not waiting:
+                logging.info('[ci][lock] all %d slots of %s are used, waiting' % (self.slots, self.lock_dir))
+                waiting = True
+            time.sleep(self.poll)
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.fd.close()
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -5,9 +5,10 @@ import os
 import re
 import subprocess
 import sys
+import threading
 import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import requests
 import yaml
 try:
     from yaml import CLoader as Loader, CDumper as Dumper
@@ -15,12 +16,18 @@ except ImportError:
     from yaml import Loader, Dumper
 
 from biocontainersci.ci import CI
-from biocontainersci.utils import send_github_pr_comment, send_status
+from biocontainersci.metrics import Metrics
+from biocontainersci.planner import push_range, pull_request_head, changed_containers
+from biocontainersci.pr_files import PullRequestFiles
+from biocontainersci.utils import send_github_pr_comment, send_status, github_client, CommentBuffer
 
 class BiocontainersException(Exception):
     pass
 
 
+ARCHS = ['amd64', 'arm64']
+
+
 
 def git_modified_files(config, commit):
     files = []
@@ -41,27 +48,24 @@ def git_modified_files(config, commit):
 def github_pull_request_files(config):
     repo = os.environ['GITHUB_REPOSITORY']
     # refs/pull/<pr_number>/merge
-    url = f"/repos/{repo}/pulls/{config['pull_number']}/files"
-    gh_url = os.environ['GITHUB_API_URL']
-
-    res = requests.get(
-        gh_url + url,
-        headers={'Accept': 'application/vnd.github.v3+json'}
-    )
-    files = res.json()
+    gh_url = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+    pull_url = f"{gh_url}/repos/{repo}/pulls/{config['pull_number']}"
+
+    pr_files = PullRequestFiles(github_client(config), cache_dir=os.path.join(config.get('tmpdir', '/tmp'), 'pr-files'))
+    files = pr_files.files(pull_url, head_sha=pull_request_head())
     containers = []
     for pull_file in files:
         if '.github' in pull_file['filename']:
             msg = 'Cannot modify github CI files....'
             logging.error(msg)
-            send_github_pr_comment(config, msg)
+            send_github_pr_comment(config, msg, section='pull request')
             raise BiocontainersException(msg)
         logging.info('[ci][github][pull request] ' + pull_file['filename'])
         filenames = pull_file['filename'].split('/')
         if len(filenames) < 2:
             msg = "You're trying to update a file not related to a container: " + str(pull_file['filename']) + ", this is forbidden"
             logging.error(msg)
-            send_github_pr_comment(config, msg)
+            send_github_pr_comment(config, msg, section='pull request')
             raise BiocontainersException(msg)
         container_path = '/'.join([filenames[0], filenames[1]])
         if container_path not in containers:
@@ -70,14 +74,14 @@ def github_pull_request_files(config):
     if len(containers) > 1 or len(containers) == 0:
         msg = "can't modify multiple containers in a same pull request"
         logging.error(msg)
-        send_github_pr_comment(config, msg)
+        send_github_pr_comment(config, msg, section='pull request')
         raise BiocontainersException(msg)
 
     container_dir = containers[0].split('/')
     if len(container_dir) != 2:
         msg = "Invalid structure, Dockerfile must be in directory softwarename/softwareversion/Dockerfile"
         logging.error(msg)
-        send_github_pr_comment(config, msg)
+        send_github_pr_comment(config, msg, section='pull request')
         raise BiocontainersException(msg)
 
     params = [{
@@ -95,25 +99,144 @@ def github(config):
         files = github_pull_request_files(config)
         # /repos/{owner}/{repo}/pulls/{pull_number}/files
     elif config['commit']:
-        files = git_modified_files(config, config['commit'])
+        commits = push_range(config['commit'])
+        if commits is None:
+            return git_modified_files(config, config['commit'])
+        # all commits of the push
+        logging.info('[ci][github][push] ' + commits[0] + '..' + commits[1])
+        workdir = os.environ.get('GITHUB_WORKSPACE', os.getcwd())
+        try:
+            files = changed_containers(workdir, commits[0], commits[1])
+        except subprocess.CalledProcessError as e:
+            # before commit not in clone (shallow checkout)
+            logging.warning('[ci][github][push] failed to diff push range, use last commit only: ' + str(e))
+            files = git_modified_files(config, config['commit'])
     return files
 
 
 def bioworkflow(config, f):
     ci = CI(config)
+    arch = config.get('arch') or ARCHS
+    if 'arm64' not in arch:
+        return ci.workflow(f)
+    if 'amd64' not in arch:
+        # manifest needs both images, it is built by jobs building both archs
+        ci.precheck(f)
+        return ci.workflow_arm(f)
+
+    if config.get('build', {}).get('arm_parallel', False) and not config['pull_number']:
+        # start arm build once dockerfile is checked, in parallel of amd workflow
+        ci.precheck(f)
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix=threading.current_thread().name) as executor:
+            amd = executor.submit(ci.workflow, f)
+            arm = executor.submit(ci.workflow_arm, f, wait_for=amd)
+            amd_build = amd.result()
+            arm_build = arm.result()
+        if amd_build and arm_build:
+            ci.manifest(f)
+        return amd_build
+
     amd_build = ci.workflow(f)
     if amd_build:
         arm_build = ci.workflow_arm(f)
         if arm_build:
-            ci.build_manifest(f)
+            ci.manifest(f)
     return amd_build
 
+
+def container_job(config, f):
+    '''
+    Run bioworkflow for one container with its own config copy
+
+    Workflow runs in a thread named after the container, used as log prefix,
+    threads started by the workflow are named after it.
+    Singularity conversions use their own scratch dir (see CI.singularity)
+    '''
+    name = f['container'] + '/' + f['version']
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix=name) as executor:
+        return executor.submit(bioworkflow, copy.deepcopy(config), f).result()
+
+
+def run_jobs(config, files, jobs=1):
+    '''
+    Run container workflows, up to jobs at the same time
+
+    Returns a dict of container/version => status
+    '''
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(container_job, config, f): f['container'] + '/' + f['version'] for f in files}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = 'success' if future.result() else 'failure'
+            except Exception as e:
+                logging.exception('[ci][' + name + '] error: ' + str(e))
+                results[name] = 'error: ' + str(e)
+            logging.info('[ci][' + name + '] ' + results[name])
+    return results
+
+
+def build_matrix(config, files):
+    '''
+    Build matrix of containers, each entry is built by a biocontainers-build job with entry args
+
+    Entries carry the event context (commit, pull request) and arch,
+    the architectures built by the job (no arm build for pull requests)
+    '''
+    arch = ['amd64']
+    if not config['pull_number']:
+        arch.append('arm64')
+    include = []
+    for f in files:
+        dockerfile = '/'.join([f['container'], f['version'], 'Dockerfile'])
+        args = ['--file', dockerfile]
+        if config['commit']:
+            args += ['--commit', config['commit']]
+        if config['pull_number']:
+            args += ['--pull-number', str(config['pull_number'])]
+        for a in arch:
+            args += ['--arch', a]
+        include.append({
+            'container': f['container'],
+            'version': f['version'],
+            'file': dockerfile,
+            'commit': config['commit'],
+            'pull_number': config['pull_number'],
+            'arch': arch,
+            'args': ' '.join(args)
+        })
+    return {'include': include}
+
+
+def output_plan(matrix):
+    '''
+    Print build matrix, also set as matrix step output in GitHub Actions
+
+    has_jobs step output is false if matrix is empty, GitHub Actions rejects empty matrix
+    '''
+    plan = json.dumps(matrix)
+    print(plan)
+    if os.environ.get('GITHUB_OUTPUT'):
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as fp:
+            fp.write('matrix=' + plan + '\n')
+            fp.write('has_jobs=' + ('true' if matrix['include'] else 'false') + '\n')
+
+
 @click.command()
 @click.option('--file', help='Dockerfile')
 @click.option('--commit', help='Commit SHA')
+@click.option('--pull-number', help='Pull request number (default from GITHUB_REF)')
+@click.option('--arch', multiple=True, type=click.Choice(ARCHS), help='architecture to build, can be repeated (default all)')
 @click.option('--dry/--no-dry', default=False, help="dry run mode")
-def run(file, commit, dry):
-    logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
+@click.option('--jobs', default=1, type=int, help='number of containers to build in parallel')
+@click.option('--plan', is_flag=True, default=False, help='only output JSON build matrix of containers to build')
+@click.option('--resume/--no-resume', default=False, help='skip stages already done for pushed image (see checkpoints)')
+def run(file, commit, pull_number, arch, dry, jobs, plan, resume):
+    log_format = logging.BASIC_FORMAT
+    if jobs > 1:
+        log_format = '%(levelname)s:[%(threadName)s]:%(message)s'
+    logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"), format=log_format)
     config = None
     with open(os.environ.get('CONFIG', '/etc/biocontainers-ci/config.yml')) as f:
         config = yaml.load(f, Loader=yaml.Loader)
@@ -121,8 +244,30 @@ def run(file, commit, dry):
     files = []
     config['commit'] = None
     config['dry'] = dry
+    config['resume'] = resume
     config['pull_number'] = None
+    config['arch'] = list(arch) or ARCHS
+    # PR comments are sent in a single comment at the end of the run
+    config['comments'] = CommentBuffer()
+    # stage metrics of all jobs, written at the end of the run
+    config['run_metrics'] = Metrics(config)
     try:
+        # event context, options override GitHub env (--file jobs of a build matrix)
+        if not commit and os.environ.get('GITHUB_SHA', None):
+            commit = os.environ['GITHUB_SHA']
+        if commit:
+            logging.info('Commit ' + commit)
+            config['commit'] = commit
+
+        if not pull_number and os.environ.get('GITHUB_REF', None):
+            ref = os.environ['GITHUB_REF']
+            m = re.search('refs/pull/(\d+)/merge', ref)
+            if m:
+                pull_number = m.group(1)
+        if pull_number:
+            config['pull_number'] = pull_number
+            logging.info('[ci] pull request ' + str(pull_number))
+
         if file:
             if not os.path.exists(file):
                 raise BiocontainersException('file not found')
@@ -132,36 +277,30 @@ def run(file, commit, dry):
                 'version': elts[len(elts)-2],
             }]
         else:
-            if commit:
-                logging.info('Commit ' + commit)
-                config['commit'] = commit
-
-            if os.environ.get('GITHUB_SHA', None):
-                commit = os.environ['GITHUB_SHA']
-                logging.info('Commit ' + commit)
-                config['commit'] = commit
-
-            if os.environ.get('GITHUB_REF', None):
-                ref = os.environ['GITHUB_REF']
-                m = re.search('refs/pull/(\d+)/merge', ref)
-                if m:
-                    pull_number = m.group(1)
-                    config['pull_number'] = pull_number
-                    logging.info('[ci] pull request ' + str(pull_number))
-
             files = github(config)
     except Exception as e:
         logging.error('Something went wrong: ' + str(e))
+        config['comments'].flush(config)
         sys.exit(1)
 
+    if plan:
+        # no build, matrix entries are built by other jobs
+        output_plan(build_matrix(config, files))
+        config['comments'].flush(config)
+        return
+
     if not files:
         send_status(config, '',False, 'could not find any Dockerfile')
         sys.exit(1)
 
-    for f in files:
-        status = bioworkflow(config, f)
-        if not status:
-            sys.exit(1)
+    results = run_jobs(config, files, jobs)
+    config['comments'].flush(config)
+    config['run_metrics'].write(results)
+    logging.info('[ci] summary:')
+    for name in sorted(results.keys()):
+        logging.info('[ci]   ' + name + ': ' + results[name])
+    if [status for status in results.values() if status != 'success']:
+        sys.exit(1)
 
 if __name__ == '__main__':
     run()
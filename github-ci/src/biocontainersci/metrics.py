@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from biocontainersci.utils import BiocontainersCIException
+
+
+class Metrics:
+    '''
+    Duration, bytes and outcome of workflow stages
+
+    Stages of all jobs of a run are collected, then written at end of run
+    as a JSON run record (in metrics.record dir) and a Prometheus textfile
+    (metrics.textfile, for node exporter textfile collector).
+
+    Outcome is success, failure (BiocontainersCIException), error (other exceptions)
+    or skipped (set by caller).
+    '''
+
+    PREFIX = 'biocontainers_ci'
+
+    def __init__(self, config=None):
+        self.config = (config or {}).get('metrics', {}) or {}
+        self.start = time.time()
+        self.records = []
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # shared by the config copies of parallel jobs
+        return self
+
+    @contextmanager
+    def stage(self, f, stage, arch='amd64'):
+        '''
+        Measure a stage, yields the stage record
+
+        Caller can set record['outcome'] and record['bytes'][kind]
+        '''
+        record = {
+            'container': f['container'],
+            'version': f['version'],
+            'arch': arch,
+            'stage': stage,
+            'outcome': 'success',
+            'bytes': {},
+            'start': time.time()
+        }
+        try:
+            yield record
+        except BiocontainersCIException:
+            record['outcome'] = 'failure'
+            raise
+        except Exception:
+            record['outcome'] = 'error'
+            raise
+        finally:
+            record['duration'] = time.time() - record['start']
+            record['bytes'] = {kind: size for (kind, size) in record['bytes'].items() if size is not None}
+            with self.lock:
+                self.records.append(record)
+            logging.info('[ci][metrics] %s/%s %s %s: %s in %.1fs' % (
+                f['container'], f['version'], arch, stage, record['outcome'], record['duration']
+            ))
+
+    def run_record(self, results=None):
+        end = time.time()
+        with self.lock:
+            stages = list(self.records)
+        return {
+            'start': self.start,
+            'end': end,
+            'duration': end - self.start,
+            'results': results or {},
+            'stages': stages
+        }
+
+    def textfile(self, run):
+        '''
+        Prometheus text exposition of run record
+        '''
+        lines = []
+
+        def metric(name, help, values):
+            lines.append('# HELP %s_%s %s' % (self.PREFIX, name, help))
+            lines.append('# TYPE %s_%s gauge' % (self.PREFIX, name))
+            for (labels, value) in values:
+                labels = '{' + self._labels(labels) + '}' if labels else ''
+                lines.append('%s_%s%s %s' % (self.PREFIX, name, labels, repr(float(value))))
+
+        keys = ['container', 'version', 'arch', 'stage']
+        metric('stage_duration_seconds', 'Duration of workflow stage', [
+            (dict([(k, s[k]) for k in keys] + [('outcome', s['outcome'])]), s['duration']) for s in run['stages']
+        ])
+        metric('stage_bytes', 'Bytes handled by workflow stage (image size, pushed bytes, SIF size)', [
+            (dict([(k, s[k]) for k in keys] + [('kind', kind)]), size) for s in run['stages'] for (kind, size) in sorted(s['bytes'].items())
+        ])
+        outcomes = {}
+        for s in run['stages']:
+            outcomes[(s['stage'], s['outcome'])] = outcomes.get((s['stage'], s['outcome']), 0) + 1
+        metric('stage_outcomes', 'Number of workflow stages per outcome in last run', [
+            ({'stage': stage, 'outcome': outcome}, count) for ((stage, outcome), count) in sorted(outcomes.items())
+        ])
+        jobs = {}
+        for status in run['results'].values():
+            status = status if status in ['success', 'failure'] else 'error'
+            jobs[status] = jobs.get(status, 0) + 1
+        metric('jobs', 'Number of container jobs per status in last run', [
+            ({'status': status}, count) for (status, count) in sorted(jobs.items())
+        ])
+        metric('run_duration_seconds', 'Duration of last run', [({}, run['duration'])])
+        metric('run_timestamp_seconds', 'End time of last run', [({}, run['end'])])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, results=None):
+        '''
+        Write run record and textfile, if configured
+        '''
+        if not self.config.get('record') and not self.config.get('textfile'):
+            return
+        run = self.run_record(results)
+        try:
+            if self.config.get('record'):
+                os.makedirs(self.config['record'], exist_ok=True)
+                name = 'run-%s-%d.json' % (time.strftime('%Y%m%dT%H%M%S', time.gmtime(run['start'])), os.getpid())
+                self._write(os.path.join(self.config['record'], name), json.dumps(run, indent=2))
+            if self.config.get('textfile'):
+                self._write(self.config['textfile'], self.textfile(run))
+        except Exception as e:
+            logging.warning('[ci][metrics] failed to write metrics: ' + str(e))
+
+    @staticmethod
+    def _labels(labels):
+        escaped = []
+        for (name, value) in labels.items():
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append('%s="%s"' % (name, value))
+        return ','.join(escaped)
+
+    @staticmethod
+    def _write(path, content):
+        # atomic replace, node exporter must not read partial files
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.metrics-')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import subprocess
+
+NULL_SHA = '0' * 40
+
+
+def event():
+    '''
+    GitHub event payload, None if not available
+    '''
+    event_path = os.environ.get('GITHUB_EVENT_PATH')
+    if not event_path or not os.path.exists(event_path):
+        return None
+    try:
+        with open(event_path, 'r') as fp:
+            return json.load(fp)
+    except Exception as e:
+        logging.warning('[ci][planner] failed to read event: ' + str(e))
+        return None
+
+
+def pull_request_head():
+    '''
+    Head commit of pull request event, None if unknown
+    '''
+    payload = event()
+    if not payload or 'pull_request' not in payload:
+        return None
+    return payload['pull_request'].get('head', {}).get('sha')
+
+
+def push_range(commit):
+    '''
+    Pushed commit range (before, after) from GitHub push event
+
+    Returns None if not a push event of commit, or if before is unknown (new branch)
+    '''
+    payload = event()
+    if not payload:
+        return None
+    before = payload.get('before')
+    after = payload.get('after')
+    if not before or before == NULL_SHA or not after or after != commit:
+        return None
+    return (before, after)
+
+
+def changed_containers(workdir, before, after):
+    '''
+    Containers with a Dockerfile added or modified between before and after, in a single git diff
+
+    Deleted Dockerfiles are ignored, renamed ones count as added.
+    Returns a sorted list of unique {'container': x, 'version': y}
+    '''
+    output = subprocess.check_output(
+        ['git', 'diff', '--name-status', '--no-renames', '-z', before, after],
+        cwd=workdir
+    )
+    # -z output: status NUL path NUL ...
+    elts = output.decode('UTF-8').split('\0')
+    containers = set()
+    for (status, path) in zip(elts[0::2], elts[1::2]):
+        logging.info('[ci][github][push] ' + status + ' ' + path)
+        if status == 'D':
+            continue
+        dockerfile = path.split('/')
+        if len(dockerfile) != 3 or dockerfile[2] != 'Dockerfile':
+            continue
+        containers.add((dockerfile[0], dockerfile[1]))
+    return [{'container': container, 'version': version} for (container, version) in sorted(containers)]
@@ -0,0 +1,112 @@
+# Only depends on requests, also used by proxy/ci-proxy.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import requests
+
+
+class PullRequestFiles:
+    '''
+    Files of a pull request, following pagination
+
+    Lists are cached (in memory, and on disk if cache_dir is set) with the PR head SHA
+    and the ETag of each page. Cached list is used as is if head SHA did not change,
+    else pages are revalidated with If-None-Match (304 answers do not count in rate limit).
+
+    session: requests.Session or GithubClient, with authentication headers
+    max_entries: max pull requests kept in memory cache
+    '''
+
+    def __init__(self, session=None, cache_dir=None, per_page=100, timeout=30, max_entries=1000):
+        self.session = session or requests.Session()
+        self.cache_dir = cache_dir
+        self.per_page = per_page
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def files(self, pull_url, head_sha=None):
+        '''
+        List files of pull request
+
+        pull_url: API url of pull request (https://api.github.com/repos/{repo}/pulls/{number})
+        head_sha: head commit of pull request, if known
+        '''
+        cached = self._load(pull_url)
+        if cached and head_sha and cached.get('head_sha') == head_sha:
+            logging.info('[github][pr files] %s unchanged at %s, use cache' % (pull_url, head_sha))
+            return [pull_file for page in cached['pages'] for pull_file in page['files']]
+
+        cached_pages = cached['pages'] if cached else []
+        pages = []
+        page_number = 1
+        not_modified = 0
+        while True:
+            headers = {'Accept': 'application/vnd.github.v3+json'}
+            if page_number <= len(cached_pages) and cached_pages[page_number - 1].get('etag'):
+                headers['If-None-Match'] = cached_pages[page_number - 1]['etag']
+            res = self.session.get(
+                pull_url + '/files',
+                params={'per_page': self.per_page, 'page': page_number},
+                headers=headers,
+                timeout=self.timeout
+            )
+            if res.status_code == 304:
+                page = cached_pages[page_number - 1]
+                not_modified += 1
+            else:
+                res.raise_for_status()
+                page = {
+                    'etag': res.headers.get('ETag'),
+                    'files': res.json(),
+                    'next': 'next' in res.links
+                }
+            pages.append(page)
+            if not page['next']:
+                break
+            page_number += 1
+
+        logging.info('[github][pr files] %s: %d pages, %d not modified' % (pull_url, len(pages), not_modified))
+        self._save(pull_url, {'head_sha': head_sha, 'pages': pages})
+        return [pull_file for page in pages for pull_file in page['files']]
+
+    def _cache_file(self, pull_url):
+        return os.path.join(self.cache_dir, 'pr-files-' + hashlib.sha1(pull_url.encode()).hexdigest() + '.json')
+
+    def _load(self, pull_url):
+        with self.lock:
+            if pull_url in self.cache:
+                return self.cache[pull_url]
+        if not self.cache_dir or not os.path.exists(self._cache_file(pull_url)):
+            return None
+        try:
+            with open(self._cache_file(pull_url), 'r') as fp:
+                return json.load(fp)
+        except Exception as e:
+            logging.warning('[github][pr files] failed to read cache: ' + str(e))
+            return None
+
+    def _save(self, pull_url, entry):
+        with self.lock:
+            self.cache.pop(pull_url, None)
+            self.cache[pull_url] = entry
+            while len(self.cache) > self.max_entries:
+                # oldest entry
+                self.cache.pop(next(iter(self.cache)))
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # atomic replace, cache can be shared by parallel jobs
+            (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(entry, fp)
+            os.replace(tmp_path, self._cache_file(pull_url))
+        except Exception as e:
+            logging.warning('[github][pr files] failed to cache files: ' + str(e))
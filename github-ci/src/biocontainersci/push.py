@@ -0,0 +1,65 @@
+import logging
+import time
+
+
+class PushProgress:
+    '''
+    Fold docker push progress events into periodic summary lines
+
+    A summary is logged every *interval* seconds, or each time the overall
+    progress crosses a new *step* percent.
+    '''
+
+    DONE = ['Pushed', 'Layer already exists', 'Mounted from']
+
+    def __init__(self, repo, interval=10, step=10):
+        self.repo = repo
+        self.interval = interval
+        self.step = step
+        self.layers = {}
+        self.last_log = time.time()
+        self.last_step = 0
+
+    def update(self, line):
+        if 'id' not in line or 'status' not in line:
+            if 'status' in line:
+                logging.info('[ci][push][' + self.repo + '] ' + line['status'])
+            return
+        layer = self.layers.setdefault(line['id'], {'current': 0, 'total': 0, 'done': False})
+        detail = line.get('progressDetail') or {}
+        if detail.get('total'):
+            layer['total'] = detail['total']
+            layer['current'] = detail.get('current', 0)
+        if any(line['status'].startswith(s) for s in self.DONE):
+            layer['done'] = True
+            layer['current'] = layer['total']
+
+        percent = self.percent()
+        now = time.time()
+        if now - self.last_log >= self.interval or percent // self.step > self.last_step:
+            self.last_step = percent // self.step
+            self.log()
+
+    def percent(self):
+        if not self.layers:
+            return 0
+        total = sum(layer['total'] for layer in self.layers.values())
+        if not total:
+            done = len([layer for layer in self.layers.values() if layer['done']])
+            return int(done * 100 / len(self.layers))
+        current = sum(layer['current'] for layer in self.layers.values())
+        return int(current * 100 / total)
+
+    def sent(self):
+        '''
+        Bytes sent, layers already in registry are not counted
+        '''
+        return sum(layer['current'] for layer in self.layers.values())
+
+    def log(self):
+        self.last_log = time.time()
+        done = len([layer for layer in self.layers.values() if layer['done']])
+        sent = self.sent()
+        logging.info('[ci][push][%s] %d/%d layers done, %d MB sent, %d%%' % (
+            self.repo, done, len(self.layers), sent // (1024 * 1024), self.percent()
+        ))
@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from biocontainersci.utils import BiocontainersCIException
+
+MB = 1024 * 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def s3_client(config):
+    '''
+    Get s3 client for config, clients are shared (boto3 clients are thread safe)
+    '''
+    key = (config['s3']['endpoint'], config['s3']['region'], config['s3']['access_key'])
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = boto3.client(
+                service_name="s3",
+                region_name=config['s3']['region'],
+                endpoint_url=config['s3']['endpoint'],
+                verify=False,
+                aws_access_key_id=config['s3']['access_key'],
+                aws_secret_access_key=config['s3']['secret_access_key'])
+        return _clients[key]
+
+
+class S3Uploader:
+    '''
+    Multipart upload to s3 with parallel parts, resume and ETag check
+
+    Parts of an unfinished upload of the same key and metadata are reused if their md5 match,
+    upload is retried s3.retries times, resuming from uploaded parts.
+    Upload id and metadata of the running multipart upload are kept in a <key>.upload object,
+    S3 does not return metadata of unfinished uploads.
+    '''
+
+    UPLOAD_SUFFIX = '.upload'
+
+    def __init__(self, config):
+        self.config = config
+        self.client = s3_client(config)
+        self.bucket = config['s3']['bucket']
+        self.chunk_size = config['s3'].get('chunk_size', 64) * MB
+        self.workers = config['s3'].get('workers', 4)
+        self.retries = config['s3'].get('retries', 3)
+        self.verify_etag = config['s3'].get('verify_etag', True)
+
+    def upload(self, path, key, metadata=None):
+        size = os.path.getsize(path)
+        for attempt in range(self.retries):
+            try:
+                if size <= self.chunk_size:
+                    etag = self.upload_single(path, key, metadata)
+                else:
+                    etag = self.upload_multipart(path, key, size, metadata)
+                self.verify(key, size, etag)
+                return etag
+            except Exception as e:
+                logging.warning('[ci][s3] upload of %s failed (attempt %d/%d): %s' % (key, attempt + 1, self.retries, str(e)))
+        raise BiocontainersCIException('s3 upload failed for ' + key)
+
+    def upload_single(self, path, key, metadata=None):
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        md5 = hashlib.md5(data)
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentMD5=base64.b64encode(md5.digest()).decode(),
+            Metadata=metadata or {}
+        )
+        return '"' + md5.hexdigest() + '"'
+
+    def upload_multipart(self, path, key, size, metadata=None):
+        (upload_id, uploaded) = self.resume(key, metadata)
+        if upload_id is None:
+            res = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, Metadata=metadata or {})
+            upload_id = res['UploadId']
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=key + self.UPLOAD_SUFFIX,
+                Body=json.dumps({'upload_id': upload_id, 'metadata': metadata or {}}).encode()
+            )
+            logging.info('[ci][s3] new multipart upload for ' + key)
+
+        nb_parts = (size + self.chunk_size - 1) // self.chunk_size
+
+        def upload_part(part_number):
+            with open(path, 'rb') as fp:
+                fp.seek((part_number - 1) * self.chunk_size)
+                data = fp.read(self.chunk_size)
+            md5 = hashlib.md5(data)
+            etag = '"' + md5.hexdigest() + '"'
+            if uploaded.get(part_number) == etag:
+                return (part_number, md5.digest(), etag)
+            if part_number in uploaded:
+                raise BiocontainersCIException('part %d of previous upload does not match' % part_number)
+            res = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=data,
+                ContentMD5=base64.b64encode(md5.digest()).decode()
+            )
+            return (part_number, md5.digest(), res['ETag'])
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=threading.current_thread().name) as executor:
+                parts = list(executor.map(upload_part, range(1, nb_parts + 1)))
+        except BiocontainersCIException:
+            # previous upload is for an other file, restart from scratch
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            self.client.delete_object(Bucket=self.bucket, Key=key + self.UPLOAD_SUFFIX)
+            raise
+        logging.info('[ci][s3] %d parts uploaded (%d resumed)' % (nb_parts, len(uploaded)))
+
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': part_number, 'ETag': etag} for (part_number, _, etag) in parts]}
+        )
+        self.client.delete_object(Bucket=self.bucket, Key=key + self.UPLOAD_SUFFIX)
+        md5 = hashlib.md5(b''.join([digest for (_, digest, _) in parts]))
+        return '"%s-%d"' % (md5.hexdigest(), nb_parts)
+
+    def resume(self, key, metadata=None):
+        '''
+        Find an unfinished multipart upload for key, started with the same metadata
+
+        Other unfinished uploads of key will never be resumed, they are aborted.
+
+        Returns (upload_id, {part_number: etag}), upload_id is None if not found
+        '''
+        uploads = self.client.list_multipart_uploads(Bucket=self.bucket, Prefix=key).get('Uploads', [])
+        uploads = [upload for upload in uploads if upload['Key'] == key]
+        if not uploads:
+            return (None, {})
+        upload_id = None
+        running = self.running_upload(key)
+        if running and running.get('metadata') == (metadata or {}):
+            upload_id = running.get('upload_id')
+        for upload in uploads:
+            if upload['UploadId'] != upload_id:
+                logging.info('[ci][s3] abort unfinished upload %s of %s' % (upload['UploadId'], key))
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload['UploadId'])
+        if upload_id not in [upload['UploadId'] for upload in uploads]:
+            return (None, {})
+        uploaded = {}
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                uploaded[part['PartNumber']] = part['ETag']
+        logging.info('[ci][s3] resume upload of %s, %d parts already uploaded' % (key, len(uploaded)))
+        return (upload_id, uploaded)
+
+    def running_upload(self, key):
+        '''
+        Upload id and metadata of last multipart upload started for key, None if unknown
+        '''
+        try:
+            res = self.client.get_object(Bucket=self.bucket, Key=key + self.UPLOAD_SUFFIX)
+            return json.loads(res['Body'].read())
+        except Exception as e:
+            logging.debug('[ci][s3] no running upload for %s: %s' % (key, str(e)))
+            return None
+
+    def metadata(self, key):
+        '''
+        User metadata of object, None if object does not exist
+        '''
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['Metadata']
+        except Exception as e:
+            logging.debug('[ci][s3] no object %s: %s' % (key, str(e)))
+            return None
+
+    def verify(self, key, size, etag):
+        res = self.client.head_object(Bucket=self.bucket, Key=key)
+        if res['ContentLength'] != size:
+            raise BiocontainersCIException('uploaded size %d does not match %d' % (res['ContentLength'], size))
+        if self.verify_etag and res['ETag'] != etag:
+            raise BiocontainersCIException('uploaded ETag %s does not match %s' % (res['ETag'], etag))
+        logging.info('[ci][s3] %s uploaded, ETag %s' % (key, etag))
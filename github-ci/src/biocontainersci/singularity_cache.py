@@ -0,0 +1,174 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+class LayerCache:
+    '''
+    Singularity cache dir shared by conversions, bounded to max_size bytes
+
+    Each running conversion holds a locked pin file listing its layers and start time.
+    Eviction of least recently used files skips files pinned by running conversions
+    and files modified since the oldest running conversion started.
+    Last use of files is kept in an index, file mtime is used for unknown files.
+    '''
+
+    PINS = '.pins'
+    INDEX = '.lru.json'
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(os.path.join(self.path, self.PINS), exist_ok=True)
+
+    def files(self):
+        '''
+        Cached files, dict of relative path => (size, mtime)
+        '''
+        cached = {}
+        for (root, dirs, files) in os.walk(self.path):
+            if root == self.path:
+                dirs[:] = [d for d in dirs if d != self.PINS]
+            for name in files:
+                if root == self.path and name in [self.INDEX, self.INDEX + '.lock']:
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                cached[os.path.relpath(file_path, self.path)] = (stat.st_size, stat.st_mtime)
+        return cached
+
+    @contextmanager
+    def index_lock(self):
+        with open(os.path.join(self.path, self.INDEX + '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    @contextmanager
+    def use(self, layers=None):
+        '''
+        Use cache for a conversion, logs hit/miss report
+
+        layers: digests (sha256:...) of image layers as stored in cache, pinned during conversion
+        and used to count hits, None if unknown (files added during conversion are still kept)
+        '''
+        pin_dir = os.path.join(self.path, self.PINS)
+        blobs_needed = [layer.split(':')[-1] for layer in (layers or [])]
+        # pin is created under index lock, a running eviction cannot remove its layers
+        with self.index_lock():
+            (fd, tmp_path) = tempfile.mkstemp(dir=pin_dir, prefix='.tmp-')
+            pin = os.fdopen(fd, 'w')
+            json.dump({'start': time.time(), 'blobs': blobs_needed}, pin)
+            pin.flush()
+            fcntl.flock(pin, fcntl.LOCK_EX)
+            pin_path = tmp_path.replace('.tmp-', '') + '.pin'
+            os.rename(tmp_path, pin_path)
+        try:
+            before = self.files()
+            blobs = set([os.path.basename(name) for name in before.keys()])
+            hits = [blob for blob in blobs_needed if blob in blobs]
+            yield self
+            after = self.files()
+        finally:
+            os.unlink(pin_path)
+            pin.close()
+
+        misses = [name for name in after.keys() if name not in before]
+        self.touch(misses + [name for name in after.keys() if os.path.basename(name) in hits])
+        report = '%d new files (%d MB), cache size %d MB' % (
+            len(misses),
+            sum([after[name][0] for name in misses]) // (1024 * 1024),
+            sum([size for (size, _) in after.values()]) // (1024 * 1024)
+        )
+        if layers is None:
+            logging.info('[ci][singularity][cache] layers unknown, ' + report)
+        else:
+            logging.info('[ci][singularity][cache] %d/%d layers in cache, %s' % (len(hits), len(layers), report))
+
+    def pins(self):
+        '''
+        Running conversions: (oldest start time or None, set of pinned blobs)
+
+        Pin files not locked anymore (conversion process died) are removed
+        '''
+        pin_dir = os.path.join(self.path, self.PINS)
+        oldest = None
+        pinned = set()
+        for name in os.listdir(pin_dir):
+            if not name.endswith('.pin'):
+                continue
+            pin_path = os.path.join(pin_dir, name)
+            try:
+                with open(pin_path, 'r') as pin:
+                    try:
+                        fcntl.flock(pin, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                        # not locked, stale pin
+                        os.unlink(pin_path)
+                        continue
+                    except OSError:
+                        pass
+                    content = json.load(pin)
+            except (OSError, ValueError):
+                continue
+            pinned.update(content['blobs'])
+            if oldest is None or content['start'] < oldest:
+                oldest = content['start']
+        return (oldest, pinned)
+
+    def touch(self, names):
+        '''
+        Record last use of files
+        '''
+        with self.index_lock():
+            index = self.index()
+            now = time.time()
+            for name in names:
+                index[name] = now
+            with open(os.path.join(self.path, self.INDEX), 'w') as fp:
+                json.dump(index, fp)
+
+    def index(self):
+        try:
+            with open(os.path.join(self.path, self.INDEX), 'r') as fp:
+                return json.load(fp)
+        except Exception:
+            return {}
+
+    def evict(self):
+        '''
+        Remove least recently used files until cache size is below max_size
+
+        Files used by running conversions are kept, cache can stay above max_size until they end.
+        '''
+        with self.index_lock():
+            cached = self.files()
+            size = sum([size for (size, _) in cached.values()])
+            if size <= self.max_size:
+                return
+            (oldest, pinned) = self.pins()
+            index = self.index()
+            lru = sorted(cached.keys(), key=lambda name: index.get(name, cached[name][1]))
+            removed = 0
+            for name in lru:
+                if size <= self.max_size:
+                    break
+                if os.path.basename(name) in pinned or (oldest is not None and cached[name][1] >= oldest):
+                    continue
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                size -= cached[name][0]
+                removed += 1
+                index.pop(name, None)
+            with open(os.path.join(self.path, self.INDEX), 'w') as fp:
+                json.dump(index, fp)
+        logging.info('[ci][singularity][cache] evicted %d files, cache size %d MB' % (removed, size // (1024 * 1024)))
+        if size > self.max_size:
+            logging.warning('[ci][singularity][cache] cache above max size, remaining files used by running conversions')
@@ -1,32 +1,277 @@
 import logging
+import threading
+import time
+
 import requests
+import urllib3
 
 class BiocontainersCIException(Exception):
     pass
 
-def send_github_pr_comment(config, comment):
+
+class GithubClient:
+    '''
+    GitHub API client with a keep-alive session
+
+    Requests are retried with backoff on connection errors, 5xx and rate limit
+    errors, and wait for rate limit reset when remaining calls are low.
+    Non idempotent requests (POST, PATCH) may have been processed on 5xx or
+    connection errors, they are only retried if connection could not be opened
+    or on rate limit errors (request rejected).
+    '''
+
+    API = 'https://api.github.com'
+    IDEMPOTENT = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+    def __init__(self, token=None, retries=3, backoff=2, min_remaining=10, max_wait=300, timeout=30):
+        self.session = requests.Session()
+        self.session.headers['Accept'] = 'application/vnd.github.v3+json'
+        if token:
+            self.session.headers['Authorization'] = 'token ' + token
+        self.retries = retries
+        self.backoff = backoff
+        self.min_remaining = min_remaining
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.remaining = None
+        self.reset = None
+        self._login = None
+        self._login_checked = False
+        self._login_lock = threading.Lock()
+
+    def login(self):
+        '''
+        Login of token user, None if unknown (no token, or token without user access
+        such as GitHub Actions and GitHub App tokens)
+        '''
+        with self._login_lock:
+            if not self._login_checked and 'Authorization' in self.session.headers:
+                self._login_checked = True
+                try:
+                    res = self.get('/user')
+                    if res.status_code == 200:
+                        self._login = res.json().get('login')
+                    else:
+                        logging.warning('[github] could not get token user: ' + str(res.status_code))
+                except Exception as e:
+                    logging.warning('[github] could not get token user: ' + str(e))
+            return self._login
+
+    def throttle(self):
+        if self.remaining is None or self.remaining > self.min_remaining or not self.reset:
+            return
+        wait = min(self.reset - time.time(), self.max_wait)
+        if wait > 0:
+            logging.warning('[github] %d calls remaining, wait %ds for rate limit reset' % (self.remaining, wait))
+            time.sleep(wait)
+
+    def request(self, method, url, **kwargs):
+        '''
+        Send request, url can be a path relative to the API url
+        '''
+        if not url.startswith('http'):
+            url = self.API + url
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            self.throttle()
+            last = attempt == self.retries
+            try:
+                res = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if last or (method.upper() not in self.IDEMPOTENT and not self.not_sent(e)):
+                    raise
+                logging.warning('[github] %s %s failed: %s' % (method, url, str(e)))
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if 'X-RateLimit-Remaining' in res.headers:
+                self.remaining = int(res.headers['X-RateLimit-Remaining'])
+                self.reset = int(res.headers.get('X-RateLimit-Reset', 0))
+            if last:
+                return res
+            if res.status_code in [403, 429] and ('Retry-After' in res.headers or self.remaining == 0):
+                wait = self.retry_after(res)
+                if not wait and self.reset:
+                    wait = self.reset - time.time()
+                if wait <= 0:
+                    # no hint or reset already passed
+                    wait = self.backoff * 2 ** attempt
+                wait = max(0, min(wait, self.max_wait))
+                logging.warning('[github] rate limited, retry in %ds' % wait)
+                time.sleep(wait)
+                continue
+            if res.status_code >= 500 and method.upper() in self.IDEMPOTENT:
+                logging.warning('[github] %s %s error %d' % (method, url, res.status_code))
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            return res
+
+    @staticmethod
+    def retry_after(res):
+        '''
+        Seconds to wait from Retry-After header, 0 if not set or not a number of seconds
+        '''
+        try:
+            return int(res.headers.get('Retry-After', 0))
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def not_sent(e):
+        '''
+        Request failed before reaching the server (connection not opened)
+        '''
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(e.args[0], 'reason', None) if e.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+_github_clients = {}
+_github_clients_lock = threading.Lock()
+
+
+def github_client(config, token=None):
+    '''
+    Shared GitHub client for token (github token by default)
+    '''
+    if token is None:
+        token = config.get('github', {}).get('token')
+    with _github_clients_lock:
+        if token not in _github_clients:
+            github_config = config.get('github', {})
+            _github_clients[token] = GithubClient(
+                token=token,
+                retries=github_config.get('retries', 3),
+                min_remaining=github_config.get('min_remaining', 10),
+                timeout=github_config.get('timeout', 30)
+            )
+        return _github_clients[token]
+
+
+class CommentBuffer:
+    '''
+    Collect PR comments during a run, sent as a single comment by flush
+
+    The comment is marked so that next runs edit it instead of adding a new one.
+    Buffer is shared by config copies.
+    '''
+
+    MARKER = '<!-- biocontainers-ci -->'
+
+    def __init__(self):
+        self.sections = {}
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def add(self, section, comment):
+        with self.lock:
+            comments = self.sections.setdefault(section, [])
+            if comment not in comments:
+                comments.append(comment)
+
+    def body(self):
+        lines = [self.MARKER]
+        with self.lock:
+            for (section, comments) in self.sections.items():
+                lines.append('### ' + section)
+                for comment in comments:
+                    lines.append('* ' + comment)
+                lines.append('')
+        return '\n'.join(lines)
+
+    def previous_comment(self, config, pr_id):
+        '''
+        Find id of comment sent by a previous run
+
+        Comment must start with marker and be owned by token user (not a user quoting it).
+        Token user is github.login, or is read from GitHub. If unknown, comment must be
+        owned by a bot (GitHub Actions and GitHub App tokens comment as bots).
+        '''
+        login = config.get('github', {}).get('login') or github_client(config).login()
+        if login is None:
+            logging.info('[github][comment] token user unknown (see github.login), looking for a comment of a bot')
+
+        def owned(comment):
+            user = comment.get('user') or {}
+            if login is None:
+                return user.get('type') == 'Bot'
+            return user.get('login') == login
+
+        github_url = '/repos/BioContainers/containers/issues/' + str(pr_id) + '/comments'
+        res = github_client(config).get(github_url, params={'per_page': 100})
+        while True:
+            if res.status_code != 200:
+                return None
+            for comment in res.json():
+                if (comment.get('body') or '').startswith(self.MARKER) and owned(comment):
+                    return comment['id']
+            if 'next' not in res.links:
+                return None
+            res = github_client(config).get(res.links['next']['url'])
+
+    def flush(self, config):
+        pr_id = config['pull_number']
+        if not pr_id or not config['github']['token']:
+            return
+        try:
+            comment_id = self.previous_comment(config, pr_id)
+            if not self.sections:
+                if comment_id is None:
+                    return
+                self.add('biocontainers-ci', 'no remark on last run')
+            if comment_id is None:
+                logging.info('[github][comment] send comment to pr ' + str(pr_id))
+                github_client(config).post(
+                    '/repos/BioContainers/containers/issues/' + str(pr_id) + '/comments',
+                    json={'body': self.body()}
+                )
+            else:
+                logging.info('[github][comment] update comment %s of pr %s' % (str(comment_id), str(pr_id)))
+                github_client(config).patch(
+                    '/repos/BioContainers/containers/issues/comments/' + str(comment_id),
+                    json={'body': self.body()}
+                )
+        except Exception as e:
+            logging.exception(str(e))
+        with self.lock:
+            self.sections = {}
+
+
+def send_github_pr_comment(config, comment, section='general'):
+    '''
+    Send comment to PR, comment is added to config['comments'] buffer if set
+    '''
     if not config['pull_number']:
         logging.info('[github][comment] not a PR, skipping: ' + comment)
         return
     pr_id = config['pull_number']
+    if config.get('comments') is not None:
+        logging.info('[github][comment] add msg to ' + section + ': ' + str(comment))
+        config['comments'].add(section, comment)
+        return
     logging.warn('[github][comment] send comment to pr '+str(pr_id))
     logging.info('[github][comment] send msg '+str(comment))
     if not config['github']['token'] or not pr_id:
         logging.warn('[github][comment] github not configured or not a PR, not sending comment')
         return
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': 'token ' + config['github']['token']
-    }
-
-    github_url = 'https://api.github.com/repos/BioContainers/containers/issues/'  + str(pr_id) + '/comments'
+    github_url = '/repos/BioContainers/containers/issues/'  + str(pr_id) + '/comments'
     try:
-        requests.post(
+        github_client(config).post(
             github_url,
             json={
                 'body': comment,
-            },
-            headers=headers
+            }
         )
     except Exception as e:
         logging.exception(str(e))
@@ -48,20 +293,15 @@ def send_status(config, software, status, msg=None):
     if status is False:
         is_success = 'failure'
         logging.error('Found some errors: %s' % (info))
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': 'token ' + config['github']['token']
-    }
     try:
-        github_url = 'https://api.github.com/repos/%s/statuses/%s' % (repo, config['commit'])
-        res = requests.post(
+        github_url = '/repos/%s/statuses/%s' % (repo, config['commit'])
+        res = github_client(config).post(
             github_url,
             json={
                 'description': info,
                 'state': is_success,
                 'context': 'biocontainers/status/check/' + str(software)
-            },
-            headers=headers
+            }
         )
         logging.warn('Send status info at %s: %s' % (github_url, str(res.status_code)))
     except Exception as e:
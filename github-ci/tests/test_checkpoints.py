@@ -0,0 +1,61 @@
+import os
+
+import yaml
+
+from biocontainersci.checkpoints import Checkpoints
+
+CONFIG_EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yml.example')
+
+
+def config(tmpdir, resume=False):
+    return {'tmpdir': str(tmpdir), 'dry': False, 'resume': resume}
+
+
+def test_example_config(tmpdir):
+    with open(CONFIG_EXAMPLE) as fp:
+        example = yaml.safe_load(fp)
+    example['tmpdir'] = str(tmpdir)
+    example['dry'] = False
+    checkpoints = Checkpoints(example, {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'})
+    assert checkpoints.path == os.path.join(str(tmpdir), 'checkpoints', 'test', '1.0_cv1.json')
+
+
+def test_record_and_resume(tmpdir):
+    f = {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'}
+    checkpoints = Checkpoints(config(tmpdir), f)
+    checkpoints.start('image1', 'recipe1', {'software': 'test'})
+    checkpoints.record('anchore')
+    # not in resume mode
+    assert not checkpoints.done('anchore')
+
+    checkpoints = Checkpoints(config(tmpdir, resume=True), f)
+    assert checkpoints.done('push')
+    assert checkpoints.done('anchore')
+    assert not checkpoints.done('singularity')
+    assert checkpoints.load()['recipe'] == 'recipe1'
+
+
+def test_new_digest_drops_stages(tmpdir):
+    Checkpoints(config(tmpdir), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'}).start('image1', 'recipe1', {})
+    Checkpoints(config(tmpdir), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'}).record('anchore')
+    Checkpoints(config(tmpdir), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:2'}).start('image2', 'recipe1', {})
+
+    checkpoints = Checkpoints(config(tmpdir, resume=True), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:2'})
+    assert checkpoints.done('push')
+    assert not checkpoints.done('anchore')
+
+
+def test_record_other_digest_ignored(tmpdir):
+    Checkpoints(config(tmpdir), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'}).start('image1', 'recipe1', {})
+    Checkpoints(config(tmpdir), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:2'}).record('anchore')
+    checkpoints = Checkpoints(config(tmpdir, resume=True), {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'})
+    assert not checkpoints.done('anchore')
+
+
+def test_dry_mode(tmpdir):
+    conf = config(tmpdir, resume=True)
+    conf['dry'] = True
+    checkpoints = Checkpoints(conf, {'container': 'test', 'tag': '1.0_cv1', 'digest': 'sha256:1'})
+    checkpoints.start('image1', 'recipe1', {})
+    assert not os.path.exists(checkpoints.path)
+    assert not checkpoints.done('push')
@@ -0,0 +1,183 @@
+import os
+import subprocess
+from unittest import mock
+
+import pytest
+
+from biocontainersci.checkpoints import Checkpoints
+from biocontainersci.ci import CI
+from biocontainersci.utils import BiocontainersCIException
+
+DOCKERFILE = '''FROM busybox
+LABEL software="test" \\
+    software.version="1.0" \\
+    version="2"
+'''
+
+
+@pytest.fixture
+def workdir(tmpdir, monkeypatch):
+    recipe = tmpdir.mkdir('workdir').mkdir('test').mkdir('1.0')
+    recipe.join('Dockerfile').write(DOCKERFILE)
+    monkeypatch.setenv('GITHUB_WORKSPACE', str(tmpdir.join('workdir')))
+    return tmpdir
+
+
+def new_ci(tmpdir, **kwargs):
+    config = {
+        'tmpdir': str(tmpdir),
+        'dry': False,
+        'resume': True,
+        'pull_number': None,
+        'registry': {'url': ''},
+        'dockerhub': {'username': ''}
+    }
+    config.update(kwargs)
+    with mock.patch('docker.DockerClient'):
+        return CI(config)
+
+
+def test_arm_resume_without_amd_result(workdir):
+    ci = new_ci(workdir)
+    f = {'container': 'test', 'version': '1.0'}
+    ledger = Checkpoints(ci.config, {'container': 'test', 'tag': '1.0_cv2', 'digest': 'sha256:1'})
+    ledger.start('image1', ci.recipe_hash(f), {})
+    ledger.record('arm_push')
+
+    assert ci.arm_pushed(f)
+    # amd workflow still running, arm build is skipped anyway
+    wait_for = mock.Mock()
+    assert ci.workflow_arm(f, wait_for=wait_for)
+    ci.docker_client.api.build.assert_not_called()
+    wait_for.result.assert_not_called()
+
+
+def test_arm_resume_needs_same_recipe(workdir):
+    ci = new_ci(workdir)
+    f = {'container': 'test', 'version': '1.0'}
+    ledger = Checkpoints(ci.config, {'container': 'test', 'tag': '1.0_cv2', 'digest': 'sha256:1'})
+    ledger.start('image1', 'other recipe', {})
+    ledger.record('arm_push')
+    assert not ci.arm_pushed(f)
+
+
+def test_arm_resume_not_pushed(workdir):
+    ci = new_ci(workdir)
+    f = {'container': 'test', 'version': '1.0'}
+    Checkpoints(ci.config, {'container': 'test', 'tag': '1.0_cv2', 'digest': 'sha256:1'}).start('image1', ci.recipe_hash(f), {})
+    assert not ci.arm_pushed(f)
+    assert not new_ci(workdir, resume=False).arm_pushed(f)
+
+
+def test_singularity_skip_same_recipe(workdir):
+    ci = new_ci(workdir)
+    f = {'container': 'test', 'version': '1.0', 'tag': '1.0_cv2', 'image_id': 'sha256:new', 'digest': 'sha256:newdigest'}
+    converted = {'image-id': 'sha256:old', 'digest': 'sha256:olddigest', 'recipe': ci.recipe_hash(f)}
+    with mock.patch('biocontainersci.ci.S3Uploader') as uploader:
+        uploader.return_value.metadata.return_value = converted
+        with mock.patch.object(ci, 'singularity_convert') as convert:
+            assert ci.singularity(f) is False
+            convert.assert_not_called()
+
+
+def test_singularity_convert_other_recipe(workdir):
+    ci = new_ci(workdir, singularity={'tmp': str(workdir)})
+    f = {'container': 'test', 'version': '1.0', 'tag': '1.0_cv2', 'image_id': 'sha256:new', 'digest': 'sha256:newdigest'}
+    converted = {'image-id': 'sha256:old', 'digest': 'sha256:olddigest', 'recipe': 'other'}
+    with mock.patch('biocontainersci.ci.S3Uploader') as uploader:
+        uploader.return_value.metadata.return_value = converted
+        with mock.patch.object(ci, 'singularity_convert', side_effect=Exception('convert')):
+            with pytest.raises(Exception, match='convert'):
+                ci.singularity(f)
+
+
+def test_singularity_sources(workdir):
+    f = {'container': 'test', 'version': '1.0', 'tag': '1.0_cv2'}
+    ci = new_ci(workdir, registry={'url': 'localhost:5000'}, dockerhub={'username': 'biocontainers'})
+    assert ci.singularity_source(f, 'registry', str(workdir)) == 'docker://localhost:5000/biocontainers/test:1.0_cv2'
+    assert ci.singularity_source(f, 'hub', str(workdir)) == 'docker://biocontainers/test:1.0_cv2'
+    # not pushed
+    ci = new_ci(workdir, registry={'url': 'localhost:5000'}, dockerhub={'username': 'biocontainers'}, dry=True)
+    assert ci.singularity_source(f, 'registry', str(workdir)) is None
+    assert ci.singularity_source(f, 'hub', str(workdir)) is None
+    ci = new_ci(workdir)
+    assert ci.singularity_source(f, 'registry', str(workdir)) is None
+    assert ci.singularity_source(f, 'hub', str(workdir)) is None
+
+
+def test_singularity_layers_of_local_sources(workdir):
+    ci = new_ci(workdir)
+    f = {'container': 'test', 'version': '1.0', 'tag': '1.0_cv2'}
+    ci.docker_client.images.get.return_value.attrs = {'RootFS': {'Layers': ['sha256:a']}}
+    assert ci.singularity_layers(f, 'docker-daemon') == ['sha256:a']
+    assert ci.singularity_layers(f, 'docker-archive') == ['sha256:a']
+    # compressed layers of registry manifest
+    assert ci.singularity_layers(f, 'registry') is None
+    assert ci.singularity_layers(f, 'hub') is None
+
+
+def test_cache_evicted_after_failed_conversion(workdir):
+    ci = new_ci(workdir, singularity={'tmp': str(workdir), 'sources': ['hub'], 'cache': {'path': str(workdir.join('cache'))}}, dockerhub={'username': 'biocontainers'})
+    f = {'container': 'test', 'version': '1.0', 'tag': '1.0_cv2'}
+    scratch = str(workdir.mkdir('scratch'))
+    error = subprocess.CalledProcessError(1, 'singularity', output=b'failed')
+    with mock.patch('subprocess.check_output', side_effect=error):
+        with mock.patch('biocontainersci.ci.LayerCache.evict') as evict:
+            with pytest.raises(BiocontainersCIException):
+                ci.singularity_convert(f, scratch)
+            evict.assert_called_once_with()
+
+
+def test_singularity_default_cache_kept(workdir):
+    ci = new_ci(workdir, singularity={'tmp': str(workdir), 'sources': ['hub']}, dockerhub={'username': 'biocontainers'})
+    f = {'container': 'test', 'version': '1.0', 'tag': '1.0_cv2'}
+    scratch = str(workdir.mkdir('scratch'))
+    with mock.patch('subprocess.check_output', return_value=b'') as convert:
+        ci.singularity_convert(f, scratch)
+    env = convert.call_args[1]['env']
+    assert env['SINGULARITY_CACHEDIR'] == str(workdir)
+    assert env['SINGULARITY_TMPDIR'].startswith(scratch)
+
+
+LABELS = {
+    'software': 'test',
+    'base_image': 'busybox',
+    'software.version': '1.0',
+    'version': '2',
+    'about.summary': 'a test software for tests',
+    'about.home': 'https://test.org',
+    'about.license': 'MIT',
+    'about.license_file': '/usr/share/test/LICENSE'
+}
+
+
+def check_labels(ci, labels):
+    f = {'container': 'test', 'version': '1.0'}
+    with mock.patch('biocontainersci.ci.send_status') as send_status:
+        with mock.patch.object(ci, 'check_license', return_value=[]), mock.patch.object(ci, 'check_biotools', return_value=[]), mock.patch.object(ci, 'check_bioconda', return_value=[]):
+            status = ci.check_labels(f, labels)
+    return (status, send_status.call_args[0][3], f)
+
+
+def test_check_labels(workdir):
+    (status, errors, f) = check_labels(new_ci(workdir), dict(LABELS))
+    assert status
+    assert errors == []
+    assert f['tag'] == '1.0_cv2'
+
+
+def test_check_labels_missing_software_reported(workdir):
+    labels = dict(LABELS)
+    del labels['software']
+    del labels['base_image']
+    (status, errors, _) = check_labels(new_ci(workdir), labels)
+    assert status
+    assert errors == ['software label not present', 'base_image is missing in labels']
+
+
+def test_check_labels_wrong_version(workdir):
+    labels = dict(LABELS)
+    labels['software.version'] = '2.0'
+    (status, errors, _) = check_labels(new_ci(workdir), labels)
+    assert not status
+    assert errors == ['software.version label not matching directory version name']
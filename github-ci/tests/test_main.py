@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from biocontainersci import main
+
+
+def test_job_threads_named_after_container():
+    names = []
+
+    def bioworkflow(config, f):
+        names.append(threading.current_thread().name)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix=threading.current_thread().name) as executor:
+            names.append(executor.submit(lambda: threading.current_thread().name).result())
+        return True
+
+    files = [{'container': 'test', 'version': '1.0'}]
+    with mock.patch('biocontainersci.main.bioworkflow', side_effect=bioworkflow):
+        assert main.run_jobs({}, files, jobs=2) == {'test/1.0': 'success'}
+    assert all([name.startswith('test/1.0') for name in names])
+
+
+def plan_config(pull_number=None):
+    return {'commit': 'abc', 'pull_number': pull_number}
+
+
+def test_build_matrix():
+    matrix = main.build_matrix(plan_config(), [{'container': 'test', 'version': '1.0'}])
+    assert matrix['include'] == [{
+        'container': 'test',
+        'version': '1.0',
+        'file': 'test/1.0/Dockerfile',
+        'commit': 'abc',
+        'pull_number': None,
+        'arch': ['amd64', 'arm64'],
+        'args': '--file test/1.0/Dockerfile --commit abc --arch amd64 --arch arm64'
+    }]
+    matrix = main.build_matrix(plan_config(pull_number='12'), [{'container': 'test', 'version': '1.0'}])
+    assert matrix['include'][0]['arch'] == ['amd64']
+    assert matrix['include'][0]['args'] == '--file test/1.0/Dockerfile --commit abc --pull-number 12 --arch amd64'
+
+
+def test_output_plan(tmpdir, monkeypatch, capsys):
+    output = tmpdir.join('output')
+    monkeypatch.setenv('GITHUB_OUTPUT', str(output))
+    main.output_plan(main.build_matrix(plan_config(), [{'container': 'test', 'version': '1.0'}]))
+    assert 'has_jobs=true\n' in output.read()
+
+    output.remove()
+    main.output_plan(main.build_matrix(plan_config(), []))
+    assert output.read() == 'matrix={"include": []}\nhas_jobs=false\n'
+    assert capsys.readouterr().out.splitlines()[-1] == '{"include": []}'
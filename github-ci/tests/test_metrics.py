@@ -0,0 +1,40 @@
+import json
+import os
+
+import pytest
+
+from biocontainersci.metrics import Metrics
+from biocontainersci.utils import BiocontainersCIException
+
+F = {'container': 'test', 'version': '1.0'}
+
+
+def test_stage_outcomes():
+    metrics = Metrics({'metrics': None})
+    with metrics.stage(F, 'build') as stage:
+        stage['bytes']['image_size'] = 10
+        stage['bytes']['pushed'] = None
+    with pytest.raises(BiocontainersCIException):
+        with metrics.stage(F, 'run_tests'):
+            raise BiocontainersCIException('tests failed')
+    with metrics.stage(F, 'singularity') as stage:
+        stage['outcome'] = 'skipped'
+    records = metrics.run_record()['stages']
+    assert [(r['stage'], r['outcome']) for r in records] == [('build', 'success'), ('run_tests', 'failure'), ('singularity', 'skipped')]
+    assert records[0]['bytes'] == {'image_size': 10}
+
+
+def test_write(tmpdir):
+    textfile = str(tmpdir.join('ci.prom'))
+    metrics = Metrics({'metrics': {'record': str(tmpdir.join('runs')), 'textfile': textfile}})
+    with metrics.stage(F, 'build'):
+        pass
+    metrics.write({'test/1.0': 'success'})
+    (record, ) = os.listdir(str(tmpdir.join('runs')))
+    with open(str(tmpdir.join('runs', record))) as fp:
+        assert json.load(fp)['results'] == {'test/1.0': 'success'}
+    with open(textfile) as fp:
+        content = fp.read()
+    assert 'biocontainers_ci_stage_duration_seconds{container="test",version="1.0",arch="amd64",stage="build",outcome="success"}' in content
+    assert 'biocontainers_ci_jobs{status="success"} 1.0' in content
+    assert '\nbiocontainers_ci_run_duration_seconds ' in content
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+from biocontainersci import planner
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', '-c', 'user.name=test', '-c', 'user.email=test@test', *args], cwd=repo).decode().strip()
+
+
+def commit(repo, files, message):
+    for (path, content) in files.items():
+        full_path = os.path.join(repo, path)
+        if content is None:
+            os.unlink(full_path)
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as fp:
+            fp.write(content)
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', message)
+    return git(repo, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def repo(tmpdir):
+    repo = str(tmpdir.mkdir('repo'))
+    git(repo, 'init', '-q')
+    return repo
+
+
+def test_changed_containers(repo):
+    before = commit(repo, {'a/1.0/Dockerfile': 'FROM a', 'b/1.0/Dockerfile': 'FROM b', 'c/1.0/Dockerfile': 'FROM c'}, 'init')
+    commit(repo, {'a/1.0/Dockerfile': 'FROM a2', 'a/1.0/test-cmds.txt': 'a'}, 'a')
+    commit(repo, {'d/2.0/Dockerfile': 'FROM d', 'b/1.0/Dockerfile': None}, 'd')
+    after = commit(repo, {'a/1.0/Dockerfile': 'FROM a3', 'README.md': 'readme'}, 'a again')
+    assert planner.changed_containers(repo, before, after) == [
+        {'container': 'a', 'version': '1.0'},
+        {'container': 'd', 'version': '2.0'}
+    ]
+
+
+def test_push_range(tmpdir, monkeypatch):
+    event = tmpdir.join('event.json')
+    monkeypatch.setenv('GITHUB_EVENT_PATH', str(event))
+    event.write(json.dumps({'before': 'aaa', 'after': 'bbb'}))
+    assert planner.push_range('bbb') == ('aaa', 'bbb')
+    assert planner.push_range('ccc') is None
+    # new branch
+    event.write(json.dumps({'before': planner.NULL_SHA, 'after': 'bbb'}))
+    assert planner.push_range('bbb') is None
+
+
+def test_pull_request_head(tmpdir, monkeypatch):
+    monkeypatch.delenv('GITHUB_EVENT_PATH', raising=False)
+    assert planner.pull_request_head() is None
+    event = tmpdir.join('event.json')
+    monkeypatch.setenv('GITHUB_EVENT_PATH', str(event))
+    event.write(json.dumps({'pull_request': {'head': {'sha': 'abc'}}}))
+    assert planner.pull_request_head() == 'abc'
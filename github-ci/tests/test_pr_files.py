@@ -0,0 +1,49 @@
+from unittest import mock
+
+import requests
+
+from biocontainersci.pr_files import PullRequestFiles
+
+PULL_URL = 'https://api.github.com/repos/BioContainers/containers/pulls/1'
+
+
+def page(status_code, files=None, etag=None, next_page=False):
+    res = requests.Response()
+    res.status_code = status_code
+    res._content = requests.compat.json.dumps(files or []).encode()
+    if etag:
+        res.headers['ETag'] = etag
+    if next_page:
+        res.headers['Link'] = '<' + PULL_URL + '/files?page=2>; rel="next"'
+    return res
+
+
+def test_pages_and_cache(tmpdir):
+    session = mock.Mock()
+    session.get.side_effect = [
+        page(200, [{'filename': 'a/1.0/Dockerfile'}], etag='"1"', next_page=True),
+        page(200, [{'filename': 'a/1.0/test-cmds.txt'}], etag='"2"')
+    ]
+    pr_files = PullRequestFiles(session, cache_dir=str(tmpdir))
+    files = ['a/1.0/Dockerfile', 'a/1.0/test-cmds.txt']
+    assert [f['filename'] for f in pr_files.files(PULL_URL, head_sha='abc')] == files
+
+    # same head, from disk cache
+    session.get.reset_mock()
+    pr_files = PullRequestFiles(session, cache_dir=str(tmpdir))
+    assert [f['filename'] for f in pr_files.files(PULL_URL, head_sha='abc')] == files
+    session.get.assert_not_called()
+
+    # new head, pages revalidated
+    session.get.side_effect = [page(304), page(304)]
+    assert [f['filename'] for f in pr_files.files(PULL_URL, head_sha='def')] == files
+    assert [call[1]['headers']['If-None-Match'] for call in session.get.call_args_list] == ['"1"', '"2"']
+
+
+def test_max_entries():
+    session = mock.Mock()
+    session.get.side_effect = lambda *args, **kwargs: page(200, [{'filename': 'a/1.0/Dockerfile'}])
+    pr_files = PullRequestFiles(session, max_entries=2)
+    for number in range(3):
+        pr_files.files(PULL_URL + str(number), head_sha='abc')
+    assert list(pr_files.cache.keys()) == [PULL_URL + '1', PULL_URL + '2']
@@ -0,0 +1,93 @@
+import os
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from biocontainersci import s3
+from biocontainersci.s3 import MB, S3Uploader
+
+KEY = 'SingImgsRepo/test/1.0_cv1/test_1.0_cv1.sif'
+
+
+@pytest.fixture
+def config():
+    with mock_aws():
+        s3._clients.clear()
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='biocontainers')
+        yield {
+            's3': {
+                'endpoint': None,
+                'region': 'us-east-1',
+                'access_key': 'test',
+                'secret_access_key': 'test',
+                'bucket': 'biocontainers',
+                'chunk_size': 5,
+                'retries': 2
+            }
+        }
+        s3._clients.clear()
+
+
+@pytest.fixture
+def sif(tmpdir):
+    path = str(tmpdir.join('image.sif'))
+    with open(path, 'wb') as fp:
+        fp.write(os.urandom(11 * MB))
+    return path
+
+
+def stale_upload(uploader, path, metadata):
+    # started upload of first part, process died
+    upload_id = uploader.client.create_multipart_upload(Bucket='biocontainers', Key=KEY, Metadata=metadata)['UploadId']
+    with open(path, 'rb') as fp:
+        uploader.client.upload_part(Bucket='biocontainers', Key=KEY, UploadId=upload_id, PartNumber=1, Body=fp.read(5 * MB))
+    return upload_id
+
+
+def uploads(uploader):
+    return uploader.client.list_multipart_uploads(Bucket='biocontainers').get('Uploads', [])
+
+
+def test_single_upload(config, tmpdir):
+    path = str(tmpdir.join('small.sif'))
+    with open(path, 'wb') as fp:
+        fp.write(b'sif')
+    uploader = S3Uploader(config)
+    uploader.upload(path, KEY, metadata={'image-id': 'new'})
+    assert uploader.metadata(KEY) == {'image-id': 'new'}
+
+
+def test_multipart_upload(config, sif):
+    uploader = S3Uploader(config)
+    uploader.upload(sif, KEY, metadata={'image-id': 'new'})
+    assert uploader.metadata(KEY) == {'image-id': 'new'}
+    assert uploader.metadata(KEY + S3Uploader.UPLOAD_SUFFIX) is None
+    assert not uploads(uploader)
+
+
+def test_stale_upload_other_metadata(config, sif):
+    uploader = S3Uploader(config)
+    stale_upload(uploader, sif, {'image-id': 'old'})
+    uploader.upload(sif, KEY, metadata={'image-id': 'new'})
+    assert uploader.metadata(KEY) == {'image-id': 'new'}
+    # stale upload is aborted
+    assert not uploads(uploader)
+
+
+def test_resume_same_metadata(config, sif):
+    uploader = S3Uploader(config)
+    complete = uploader.client.complete_multipart_upload
+    with mock.patch.object(uploader.client, 'complete_multipart_upload', side_effect=Exception('network error')):
+        with pytest.raises(Exception):
+            uploader.upload(sif, KEY, metadata={'image-id': 'new'})
+    assert len(uploads(uploader)) == 1
+
+    with mock.patch.object(uploader.client, 'upload_part', wraps=uploader.client.upload_part) as upload_part:
+        with mock.patch.object(uploader.client, 'complete_multipart_upload', wraps=complete):
+            uploader.upload(sif, KEY, metadata={'image-id': 'new'})
+        # all parts resumed
+        upload_part.assert_not_called()
+    assert uploader.metadata(KEY) == {'image-id': 'new'}
+    assert not uploads(uploader)
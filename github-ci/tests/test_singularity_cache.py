@@ -0,0 +1,84 @@
+import fcntl
+import json
+import os
+import time
+
+import pytest
+
+from biocontainersci.singularity_cache import LayerCache
+
+
+def blob(cache, digest, size=10, age=0):
+    path = os.path.join(cache.path, 'blob', 'blobs', 'sha256', digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fp:
+        fp.write(b'0' * size)
+    if age:
+        os.utime(path, (time.time() - age, time.time() - age))
+    return path
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return LayerCache(str(tmpdir.join('cache')), 25)
+
+
+def test_evict_least_recently_used(cache):
+    old = blob(cache, 'old', age=300)
+    used = blob(cache, 'used', age=200)
+    new = blob(cache, 'new', age=100)
+    cache.touch([os.path.relpath(used, cache.path)])
+    cache.evict()
+    assert not os.path.exists(old)
+    assert os.path.exists(used)
+    assert os.path.exists(new)
+
+
+def test_pinned_layers_kept(cache):
+    old = blob(cache, 'old', age=300)
+    pinned = blob(cache, 'pinned', age=200)
+    new = blob(cache, 'new', age=100)
+    with cache.use(['sha256:pinned']):
+        # downloaded during conversion
+        downloaded = blob(cache, 'downloaded')
+        cache.evict()
+        assert os.path.exists(pinned)
+        assert os.path.exists(downloaded)
+        assert not os.path.exists(old)
+        assert not os.path.exists(new)
+
+
+def test_unknown_layers_keep_new_files(cache):
+    old = blob(cache, 'old', age=300)
+    with cache.use(None):
+        downloaded = blob(cache, 'downloaded', size=30)
+        cache.evict()
+        assert not os.path.exists(old)
+        assert os.path.exists(downloaded)
+
+
+def test_pin_removed_after_failure(cache):
+    with pytest.raises(Exception):
+        with cache.use(['sha256:a']):
+            raise Exception('conversion failed')
+    assert cache.pins() == (None, set())
+
+
+def test_stale_pin_removed(cache):
+    pin_path = os.path.join(cache.path, LayerCache.PINS, 'dead.pin')
+    with open(pin_path, 'w') as fp:
+        json.dump({'start': time.time(), 'blobs': ['a']}, fp)
+    assert cache.pins() == (None, set())
+    assert not os.path.exists(pin_path)
+
+
+def test_running_pin(cache):
+    with cache.use(['sha256:a']):
+        (oldest, pinned) = cache.pins()
+        assert oldest is not None
+        assert pinned == set(['a'])
+        # pin is locked by conversion
+        pin_name = [name for name in os.listdir(os.path.join(cache.path, LayerCache.PINS)) if name.endswith('.pin')][0]
+        with open(os.path.join(cache.path, LayerCache.PINS, pin_name)) as pin:
+            with pytest.raises(OSError):
+                fcntl.flock(pin, fcntl.LOCK_SH | fcntl.LOCK_NB)
@@ -0,0 +1,121 @@
+from unittest import mock
+
+import pytest
+import requests
+import urllib3
+
+from biocontainersci.utils import CommentBuffer, GithubClient
+
+
+def response(status_code, headers=None, json=None):
+    res = requests.Response()
+    res.status_code = status_code
+    res.headers.update(headers or {})
+    res._content = b'{}' if json is None else requests.compat.json.dumps(json).encode()
+    return res
+
+
+@pytest.fixture
+def sleep():
+    with mock.patch('biocontainersci.utils.time.sleep') as sleep:
+        yield sleep
+
+
+def client(*responses):
+    github = GithubClient(token='test', retries=2, backoff=1)
+    github.session.request = mock.Mock(side_effect=list(responses))
+    return github
+
+
+def test_rate_limit_retry_after_zero_without_reset(sleep):
+    github = client(response(429, {'Retry-After': '0'}), response(200))
+    assert github.get('/user').status_code == 200
+    # fixed backoff
+    sleep.assert_called_once_with(1)
+
+
+def test_rate_limit_reset_passed(sleep):
+    headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1'}
+    github = client(response(403, headers), response(200))
+    assert github.get('/user').status_code == 200
+    assert sleep.call_args[0][0] >= 0
+
+
+def test_rate_limit_retry_after(sleep):
+    github = client(response(429, {'Retry-After': '5'}), response(200))
+    assert github.post('/repos/o/r/issues/1/comments', json={}).status_code == 200
+    sleep.assert_called_once_with(5)
+
+
+def test_server_error_retry_get_only(sleep):
+    github = client(response(502), response(200))
+    assert github.get('/user').status_code == 200
+    assert github.session.request.call_count == 2
+
+    github = client(response(502), response(201))
+    assert github.post('/repos/o/r/issues/1/comments', json={}).status_code == 502
+    assert github.session.request.call_count == 1
+
+
+def test_post_retried_if_not_sent(sleep):
+    not_sent = requests.exceptions.ConnectionError(urllib3.exceptions.MaxRetryError(
+        None, '/', urllib3.exceptions.NewConnectionError(None, 'refused')
+    ))
+    github = client(not_sent, response(201))
+    assert github.post('/repos/o/r/issues/1/comments', json={}).status_code == 201
+
+    github = client(requests.exceptions.ReadTimeout('timeout'), response(201))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        github.post('/repos/o/r/issues/1/comments', json={})
+
+
+def test_login_not_available(sleep):
+    github = client(response(403, json={'message': 'Resource not accessible by integration'}))
+    assert github.login() is None
+    # not asked again
+    assert github.login() is None
+    assert github.session.request.call_count == 1
+
+
+def comments_config(github, login=None):
+    config = {'pull_number': 1, 'github': {'token': 'test'}}
+    if login:
+        config['github']['login'] = login
+    return (config, mock.patch('biocontainersci.utils.github_client', return_value=github))
+
+
+def comment(id, body, login, type='User'):
+    return {'id': id, 'body': body, 'user': {'login': login, 'type': type}}
+
+
+def test_previous_comment_of_token_user(sleep):
+    comments = [
+        comment(1, '> ' + CommentBuffer.MARKER, 'someone'),
+        comment(2, CommentBuffer.MARKER + '\nquoted', 'someone'),
+        comment(3, CommentBuffer.MARKER + '\nremarks', 'biocontainers-bot')
+    ]
+    github = client(response(200, json={'login': 'biocontainers-bot'}), response(200, json=comments))
+    (config, patch) = comments_config(github)
+    with patch:
+        assert CommentBuffer().previous_comment(config, 1) == 3
+
+
+def test_previous_comment_configured_login(sleep):
+    comments = [comment(3, CommentBuffer.MARKER, 'biocontainers-bot')]
+    github = client(response(200, json=comments))
+    (config, patch) = comments_config(github, login='biocontainers-bot')
+    with patch:
+        assert CommentBuffer().previous_comment(config, 1) == 3
+    # no GET /user
+    assert github.session.request.call_count == 1
+
+
+def test_previous_comment_of_bot_without_login(sleep):
+    comments = [
+        comment(2, CommentBuffer.MARKER, 'someone'),
+        comment(3, CommentBuffer.MARKER, 'github-actions[bot]', type='Bot')
+    ]
+    github = client(response(403), response(200, json=comments))
+    (config, patch) = comments_config(github)
+    with patch:
+        assert CommentBuffer().previous_comment(config, 1) == 3
@@ -6,6 +6,7 @@ import logging
 import re
 
 import dockerparse_arg_fix
+from licenses import SpdxIndex
 
 def send_comment(comment):
     if 'GITHUB_STATUS_TOKEN' not in os.environ:
@@ -155,13 +156,12 @@ try:
         send_comment('about.summary is quite long, please keep it short < 200 chars.')
 
     # license checks
-    spdx = requests.get('https://raw.githubusercontent.com/sindresorhus/spdx-license-list/master/spdx.json')
-    licenses = spdx.json()
+    licenses = SpdxIndex(os.environ.get('SPDX_CACHE_DIR', '/tmp'))
     if labels['about.license'].startswith('http'):
         send_comment('about.license field is a URL. license should be the license identifier (GPL-3.0 for example).')
     if 'about.license_file' not in labels:
         send_comment('please specify in about.license_file the location of the license file in the container, or a url to license for this release of the software.')
-    elif labels['about.license'] != "Custom License" and labels['about.license'].replace('SPDX:', '').replace('spdx:', '') not in licenses:
+    elif labels['about.license'] != "Custom License" and labels['about.license'] not in licenses:
         send_comment('about.license field is not in spdx list: https://spdx.org/licenses/, if it is a typo error, please fix it. If this is not a standard license, please specify *Custom License* and use *about.license_file* label to specify license location (in container or url).')
 
     # biotools check
@@ -4,10 +4,15 @@ import json
 import copy
 import logging
 import os
+import sys
 
 import arrow
 import requests
 
+# shared with github-ci, copied next to ci-proxy.py in docker image
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'github-ci', 'src', 'biocontainersci'))
+from pr_files import PullRequestFiles
+
 app = Flask(__name__)
 
 # jenkins_url = 'http://localhost:8080/job/'
@@ -26,6 +31,13 @@ else:
 if 'GITHUB_STATUS_TOKEN' not in os.environ or not os.environ['GITHUB_STATUS_TOKEN']:
     logging.debug('no github token, proxy will not notify errors to github')
 
+# pooled session for github api, authenticated if token is available
+github_session = requests.Session()
+github_session.headers['Accept'] = 'application/vnd.github.v3+json'
+if os.environ.get('GITHUB_STATUS_TOKEN'):
+    github_session.headers['Authorization'] = 'token ' + str(os.environ['GITHUB_STATUS_TOKEN'])
+pull_request_files = PullRequestFiles(github_session, cache_dir=os.environ.get('PR_FILES_CACHE_DIR'))
+
 
 def send_github_pr_comment(pr_id, comment):
     logging.warn('send comment to pr '+str(pr_id))
@@ -79,11 +91,10 @@ def payload():
                 commits = payload['commits']
             elif 'pull_request' in payload:
                 logging.debug('pull request action: ' + payload['action'])
-                res = requests.get(
-                    payload['pull_request']['url'] + '/files',
-                    headers={'Accept': 'application/vnd.github.v3+json'}
+                files = pull_request_files.files(
+                    payload['pull_request']['url'],
+                    head_sha=payload['pull_request']['head']['sha']
                 )
-                files = res.json()
                 containers = []
                 for pull_file in files:
                     filenames = pull_file['filename'].split('/')